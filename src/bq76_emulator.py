@@ -0,0 +1,415 @@
+import argparse
+import math
+import os
+import select
+import threading
+import time
+import tty
+
+import numpy as np
+
+from serial_interface import (
+    ADC_CONFIG_ADDR,
+    ADC_CONFIG_CELL_SEL_MASK,
+    ADC_CONFIG_CHANNEL_BITS,
+    ADC_NB_CHANNELS,
+    ADC_RES_ADDR,
+    ADC_START_ADDR,
+    ADDR_RANGE_FULL_SIZE,
+    ADDRESS_CONTROL_ADDR,
+    BROADCAST_ADDR,
+    FAULT_STATUS_ADDR,
+    OT_REG_ADDR,
+    OV_CELLS_ADDR,
+    OV_REG_ADDR,
+    PROTECTED_REGS_FIRST_ADDR,
+    RESET_MAGIC_CODE,
+    RESET_REG_ADDR,
+    SERIAL_BAUDRATE,
+    SHDW_REG_ADDR,
+    SHDW_UNLOCK_MAGIC_CODE,
+    UV_CELLS_ADDR,
+    UV_REG_ADDR,
+    WRITE_FRAME_SIZE,
+    _print,
+    adc_conv_time,
+    crc8_func,
+    set_trace_level,
+    temp_lut,
+)
+
+# Software BQ76 slaves (Tesla Model S modules) on a Linux/macOS pseudo terminal, to run the tool
+# (or any serial_interface code) without hardware:
+#   python src/bq76_emulator.py --modules 4
+#   python src/cli.py /dev/pts/3 --chain --assign
+# or from Python:
+#   with Bq76Emulator(Bq76Chain.of(4)) as emulator:
+#       ser = con_serial_port(emulator.port)
+
+READ_PACKET_SIZE = 3
+DEVICE_STATUS_ADDR = 0x00
+# DEVICE_STATUS conversion complete flag
+DEVICE_STATUS_CNVR = 0x01
+# FAULT_STATUS cell over-voltage and under-voltage flags
+FAULT_STATUS_COV = 0x01
+FAULT_STATUS_CUV = 0x02
+FAULT_STATUS_CELLS_MASK = FAULT_STATUS_COV | FAULT_STATUS_CUV
+# OV/UV thresholds registers (see decode_ov_thr and decode_uv_thr), bit 7 disables the check
+THR_DISABLED = 0x80
+# EEPROM content, loaded in the protected registers at reset: OV 4.20V, UV 2.70V, OT 65degC
+EEPROM_DEFAULT = {OV_REG_ADDR: 0x2C, UV_REG_ADDR: 0x14, OT_REG_ADDR: 0x66}
+# Full scales of the ADC codes (see decode_adc_frames)
+GPAI_FULL_SCALE_MV = 33333
+VCELL_FULL_SCALE_MV = 6250
+ADC_CODE_MAX = 16383
+# Measured values when no waveform is given
+DEFAULT_VCELL_MV = 3700.0
+DEFAULT_TEMP_DEGC = 25.0
+# Each byte on the line: start bit, 8 data bits, stop bit
+UART_BITS_PER_BYTE = 10
+EMULATOR_POLL_PERIOD = 0.05
+# Silence after which the slaves drop a partial packet
+PACKET_RESYNC_SILENCE = 0.002
+_temp_lut_sizes = {}
+
+
+# Waveform helper: value(t) = mean + amplitude * sin(2 * pi * t / period), t in seconds
+def sine(mean, amplitude, period):
+    return lambda t: mean + amplitude * math.sin(2 * math.pi * t / period)
+
+
+def _waveform_value(waveform, t):
+    return waveform(t) if callable(waveform) else waveform
+
+
+# ADC codes of the measured values (inverse of decode_adc_frames)
+def gpai_code(mv):
+    return int(np.clip(round(mv * ADC_CODE_MAX / GPAI_FULL_SCALE_MV), 0, 0xFFFF))
+
+
+def vcell_code(mv):
+    return int(np.clip(round(mv * ADC_CODE_MAX / VCELL_FULL_SCALE_MV), 0, 0xFFFF))
+
+
+# The temperature increases with the code, up to the first code decoded as NaN: the code is
+# searched in the decoding table, so the emulated values decode exactly as the real ones.
+def temp_code(temp_id, degc):
+    lut = temp_lut(temp_id)
+    size = _temp_lut_sizes.get(temp_id)
+    if size is None:
+        size = _temp_lut_sizes[temp_id] = int(np.argmax(~np.isfinite(lut)))
+    return int(min(np.searchsorted(lut[:size], degc), size - 1))
+
+
+# One BQ76: register map, reset, address, protected registers and ADC conversions.
+# cells: 6 cell voltages (mV), temps: 2 thermistor temperatures (degC), gpai: module voltage (mV,
+# sum of the cells if None). Each value is a number or a waveform function of the time (seconds
+# since the module creation), sampled at the end of each conversion.
+# id: address already assigned (None: unaddressed, as after a reset)
+class Bq76Module:
+    def __init__(self, cells=None, temps=None, gpai=None, id=None, eeprom=None):
+        self.cells = list(cells) if cells is not None else [DEFAULT_VCELL_MV] * 6
+        self.temps = list(temps) if temps is not None else [DEFAULT_TEMP_DEGC] * 2
+        self.gpai = gpai
+        self.eeprom = dict(EEPROM_DEFAULT if eeprom is None else eeprom)
+        self.regs = bytearray(ADDR_RANGE_FULL_SIZE)
+        # Results of the last conversion (codes and cells voltages)
+        self.codes = [0] * ADC_NB_CHANNELS
+        self._cells_mv = [0.0] * 6
+        self._conv_end = None
+        self._conv_config = 0
+        self.t0 = time.perf_counter()
+        self.reset()
+        if id is not None:
+            self.regs[ADDRESS_CONTROL_ADDR] = 0x80 | id
+
+    def reset(self):
+        self.regs[:] = bytes(ADDR_RANGE_FULL_SIZE)
+        for reg_addr, val in self.eeprom.items():
+            self.regs[reg_addr] = val
+        self._conv_end = None
+
+    @property
+    def address(self):
+        control = self.regs[ADDRESS_CONTROL_ADDR]
+        return control & 0x3F if control & 0x80 else 0
+
+    def read(self, reg_addr, length, now):
+        self.update(now)
+        data = bytes(self.regs[reg_addr : reg_addr + length])
+        return data + bytes(length - len(data))
+
+    def write(self, reg_addr, val, now):
+        self.update(now)
+        if reg_addr >= ADDR_RANGE_FULL_SIZE:
+            return
+        if reg_addr >= PROTECTED_REGS_FIRST_ADDR:
+            if self.regs[SHDW_REG_ADDR] != SHDW_UNLOCK_MAGIC_CODE:
+                return
+            # One protected write per unlock
+            self.regs[SHDW_REG_ADDR] = 0
+        if reg_addr == RESET_REG_ADDR:
+            if val == RESET_MAGIC_CODE:
+                self.reset()
+        elif reg_addr == ADC_START_ADDR:
+            if val & 0x1:
+                self.start_conversion(now)
+        elif reg_addr == FAULT_STATUS_ADDR:
+            # COV/CUV flags written to 1 are cleared (latched again by the next conversion)
+            latched = self.regs[reg_addr] & FAULT_STATUS_CELLS_MASK & ~val
+            self.regs[reg_addr] = val & ~FAULT_STATUS_CELLS_MASK & 0xFF | latched
+        else:
+            self.regs[reg_addr] = val
+
+    def start_conversion(self, now):
+        self._conv_config = self.regs[ADC_CONFIG_ADDR]
+        self._conv_end = now + adc_conv_time(self._conv_config)
+        self.regs[ADC_START_ADDR] = 0x1
+        self.regs[DEVICE_STATUS_ADDR] &= ~DEVICE_STATUS_CNVR & 0xFF
+
+    # Ends the ongoing conversion if its conversion time is elapsed at now
+    def update(self, now):
+        if self._conv_end is None or now < self._conv_end:
+            return
+        self.convert(self._conv_end - self.t0)
+        self._conv_end = None
+        self.regs[ADC_START_ADDR] = 0
+        self.regs[DEVICE_STATUS_ADDR] |= DEVICE_STATUS_CNVR
+
+    # Samples the waveforms of the channels enabled in ADC_CONFIG, other results are kept
+    def convert(self, t):
+        config = self._conv_config
+        cells_mv = [_waveform_value(cell, t) for cell in self.cells]
+        nb_cells = min(config & ADC_CONFIG_CELL_SEL_MASK, 5) + 1
+        gpai_bit, ts1_bit, ts2_bit = ADC_CONFIG_CHANNEL_BITS
+        if config & gpai_bit:
+            gpai = sum(cells_mv) if self.gpai is None else _waveform_value(self.gpai, t)
+            self.codes[0] = gpai_code(gpai)
+        for cell in range(nb_cells):
+            self.codes[1 + cell] = vcell_code(cells_mv[cell])
+            self._cells_mv[cell] = cells_mv[cell]
+        for temp_id, bit in ((1, ts1_bit), (2, ts2_bit)):
+            if config & bit:
+                temp = _waveform_value(self.temps[temp_id - 1], t)
+                self.codes[6 + temp_id] = temp_code(temp_id, temp)
+        for channel, code in enumerate(self.codes):
+            self.regs[ADC_RES_ADDR + 2 * channel] = code >> 8
+            self.regs[ADC_RES_ADDR + 2 * channel + 1] = code & 0xFF
+        self.check_thresholds(nb_cells)
+
+    # Cells above the OV threshold or below the UV threshold latch the COV/CUV faults
+    def check_thresholds(self, nb_cells):
+        ov_reg = self.regs[OV_REG_ADDR]
+        uv_reg = self.regs[UV_REG_ADDR]
+        ov_cells = uv_cells = 0
+        for cell in range(nb_cells):
+            cell_mv = self._cells_mv[cell]
+            if not ov_reg & THR_DISABLED and cell_mv > 2000 + ov_reg * 50:
+                ov_cells |= 1 << cell
+            if not uv_reg & THR_DISABLED and cell_mv < 700 + uv_reg * 100:
+                uv_cells |= 1 << cell
+        self.regs[OV_CELLS_ADDR] = ov_cells
+        self.regs[UV_CELLS_ADDR] = uv_cells
+        if ov_cells:
+            self.regs[FAULT_STATUS_ADDR] |= FAULT_STATUS_COV
+        if uv_cells:
+            self.regs[FAULT_STATUS_ADDR] |= FAULT_STATUS_CUV
+
+
+# Daisy chain of Bq76Module, modules[0] being the closest to the host.
+# A packet addressed to an ID is handled by the first module with this address (after a reset,
+# the first unaddressed module takes the ID assignment write). Writes are echoed, broadcast
+# writes are handled by every module. A read is answered by the addressed module, or echoed when
+# nobody has this address. A broadcast read is answered by every module at once: with several
+# modules the answers collide on the line (bytes OR-ed, as on the open drain return line).
+class Bq76Chain:
+    def __init__(self, modules):
+        self.modules = list(modules)
+
+    # Chain of nb_modules identical modules, addressed from first_id (unaddressed if None)
+    @classmethod
+    def of(cls, nb_modules, first_id=None, **module_options):
+        return cls(
+            Bq76Module(
+                id=None if first_id is None else first_id + index, **module_options
+            )
+            for index in range(nb_modules)
+        )
+
+    def target(self, id):
+        for module in self.modules:
+            if module.address == id:
+                return module
+        return None
+
+    # Answer to one packet received at now (perf_counter time)
+    def transfer(self, packet, now):
+        id = packet[0] >> 1
+        if packet[0] & 0x1:
+            # Corrupted writes are ignored by the slaves, still echoed
+            if crc8_func(packet[:-1]) == packet[-1]:
+                if id == BROADCAST_ADDR:
+                    targets = self.modules
+                else:
+                    targets = [m for m in [self.target(id)] if m is not None]
+                for module in targets:
+                    module.write(packet[1], packet[2], now)
+            return bytes(packet)
+
+        reg_addr, length = packet[1], packet[2]
+        if id == BROADCAST_ADDR:
+            answers = [self.read_answer(m, reg_addr, length, now) for m in self.modules]
+            if not answers:
+                return bytes(packet)
+            return bytes(
+                np.bitwise_or.reduce([np.frombuffer(a, np.uint8) for a in answers])
+            )
+        module = self.target(id)
+        if module is None:
+            return bytes(packet)
+        return self.read_answer(module, reg_addr, length, now)
+
+    def read_answer(self, module, reg_addr, length, now):
+        header = bytes((module.address << 1, reg_addr, length))
+        frame = header + module.read(reg_addr, length, now)
+        return bytes((frame[0] | 0x80,)) + frame[1:] + bytes((crc8_func(frame),))
+
+
+# Bq76Chain served on a pseudo terminal (the slave side path is port, to open with pyserial).
+# latency: delay (seconds) between the end of a request and the start of its answer.
+# baudrate: the request and answer bytes take UART_BITS_PER_BYTE / baudrate seconds each on the
+# line (half duplex), and the answer is only written once fully "transmitted". None: no pacing.
+class Bq76Emulator:
+    def __init__(self, chain, latency=0.0, baudrate=SERIAL_BAUDRATE):
+        self.chain = chain
+        self.latency = latency
+        self.byte_time = 0.0 if baudrate is None else UART_BITS_PER_BYTE / baudrate
+        self.port = None
+        self.nb_packets = 0
+        self._master = None
+        self._slave = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="bq76-emulator", daemon=True
+        )
+        self._thread.start()
+        _print(f"BQ76 emulator: {len(self.chain.modules)} module(s) on {self.port}")
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        for fd in (self._master, self._slave):
+            if fd is not None:
+                os.close(fd)
+        self._master = self._slave = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def _run(self):
+        buffer = bytearray()
+        last_rx = 0.0
+        # Time at which the line is free again (end of the last answer)
+        line_free = 0.0
+        while not self._stop.is_set():
+            ready, _, _ = select.select([self._master], [], [], EMULATOR_POLL_PERIOD)
+            if not ready:
+                continue
+            try:
+                data = os.read(self._master, 4096)
+            except OSError:
+                return
+            now = time.perf_counter()
+            # A partial packet followed by a silence is dropped, as the slaves resynchronize
+            if buffer and now - last_rx > PACKET_RESYNC_SILENCE:
+                buffer.clear()
+            last_rx = now
+            buffer += data
+            while buffer:
+                size = WRITE_FRAME_SIZE if buffer[0] & 0x1 else READ_PACKET_SIZE
+                if len(buffer) < size:
+                    break
+                packet = bytes(buffer[:size])
+                del buffer[:size]
+                answer_start = (
+                    max(now, line_free) + size * self.byte_time + self.latency
+                )
+                answer = self.chain.transfer(packet, answer_start)
+                line_free = answer_start + len(answer) * self.byte_time
+                self.nb_packets += 1
+                remaining = line_free - time.perf_counter()
+                if remaining > 0:
+                    time.sleep(remaining)
+                os.write(self._master, answer)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="BQ76 (Tesla Model S module) emulator on a pseudo terminal"
+    )
+    parser.add_argument(
+        "--modules", type=int, default=1, help="number of chained modules (default: 1)"
+    )
+    parser.add_argument(
+        "--first-id",
+        type=int,
+        default=None,
+        help="IDs already assigned from FIRST_ID (default: unaddressed modules)",
+    )
+    parser.add_argument(
+        "--vcell", type=float, default=DEFAULT_VCELL_MV, help="cells voltage (mV)"
+    )
+    parser.add_argument(
+        "--ripple",
+        type=float,
+        default=0.0,
+        help="cells voltage sine amplitude (mV, 1s period)",
+    )
+    parser.add_argument(
+        "--temp", type=float, default=DEFAULT_TEMP_DEGC, help="temperatures (degC)"
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="answer latency (seconds, default: 0)",
+    )
+    parser.add_argument(
+        "--no-pacing",
+        action="store_true",
+        help=f"answer at once instead of at {SERIAL_BAUDRATE} bauds",
+    )
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    set_trace_level("info")
+    cell = sine(args.vcell, args.ripple, 1.0) if args.ripple else args.vcell
+    chain = Bq76Chain.of(
+        args.modules, first_id=args.first_id, cells=[cell] * 6, temps=[args.temp] * 2
+    )
+    emulator = Bq76Emulator(
+        chain,
+        latency=args.latency,
+        baudrate=None if args.no_pacing else SERIAL_BAUDRATE,
+    )
+    with emulator:
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
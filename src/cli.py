@@ -0,0 +1,194 @@
+import argparse
+import sys
+import time
+
+from serial_interface import (
+    TRACE_LEVELS,
+    AdcTimeout,
+    CrcNok,
+    NoSlaveFound,
+    con_serial_port,
+    disco_serial_port,
+    get_slave_id,
+    paced,
+    read_status,
+    set_trace_level,
+)
+
+# Headless monitoring: connect, find the modules and sample them continuously, without Tk.
+# Only serial_interface is imported at start, the other modules are imported when needed.
+#   python src/cli.py /dev/ttyUSB0 --chain --rate 50 --output samples.bin
+
+CSV_HEADER = "timestamp,id,gpai,vcell1,vcell2,vcell3,vcell4,vcell5,vcell6,temp1,temp2"
+STATS_PERIOD = 10.0  # seconds between two stats lines on stderr (with --stats)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="TeslaMS1 BMS headless monitoring (CSV on stdout or binary sample log)"
+    )
+    parser.add_argument("port", help="serial port (e.g. COM3, /dev/ttyUSB0)")
+    modules = parser.add_mutually_exclusive_group()
+    modules.add_argument(
+        "--ids", type=int, nargs="+", help="IDs of the modules to sample (no discovery)"
+    )
+    modules.add_argument(
+        "--chain",
+        action="store_true",
+        help="discover all the modules of the daisy chain (addressed if needed)",
+    )
+    parser.add_argument(
+        "--assign",
+        action="store_true",
+        help="with --chain, reset the chain and assign IDs from 1",
+    )
+    parser.add_argument(
+        "--snapshot",
+        action="store_true",
+        help="sample all the modules at once with a broadcast conversion start",
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=None,
+        help="module reads (or snapshots) per second (default: link maximum)",
+    )
+    parser.add_argument(
+        "--count", type=int, default=None, help="stop after COUNT reads (or snapshots)"
+    )
+    parser.add_argument(
+        "--duration", type=float, default=None, help="stop after DURATION seconds"
+    )
+    parser.add_argument(
+        "--output", help="binary sample log path (see sample_log), instead of stdout"
+    )
+    parser.add_argument(
+        "--stats", action="store_true", help="print acquisition stats on stderr"
+    )
+    parser.add_argument(
+        "--trace",
+        choices=TRACE_LEVELS.keys(),
+        default="off",
+        help="serial interface trace level (default: off)",
+    )
+    return parser.parse_args(argv)
+
+
+def find_modules(ser, args):
+    if args.ids:
+        return args.ids
+    if args.chain:
+        from pack_monitor import enumerate_chain
+
+        return enumerate_chain(ser=ser, assign=args.assign)
+    return [get_slave_id(ser=ser)]
+
+
+# Yields the list of the ModuleData which got a new sample, after each module read (round robin)
+# or snapshot (all the modules). Modules failing a read keep their previous sample, they are
+# counted in their ModuleData errors only.
+def acquire(pack, args):
+    if args.snapshot:
+        for _ in paced(args.rate, args.count):
+            snapshot = pack.snapshot()
+            yield [pack.modules[id] for id in snapshot.meas]
+    else:
+        nb_samples = {id: 0 for id in pack.ids}
+        for module in pack.poll(rate_hz=args.rate, count=args.count):
+            if module.nb_samples == nb_samples[module.id]:
+                yield []
+                continue
+            nb_samples[module.id] = module.nb_samples
+            yield [module]
+
+
+class CsvOutput:
+    def __init__(self, stream):
+        self.stream = stream
+        self.stream.write(CSV_HEADER + "\n")
+
+    def write(self, module):
+        sample = module.sample
+        values = ",".join(str(value) for value in sample.meas)
+        self.stream.write(f"{sample.timestamp:.6f},{module.id},{values}\n")
+
+    def close(self):
+        self.stream.flush()
+
+
+# The alert, fault, COV and CUV registers are read right after each sample and recorded with it
+# (a failed status read leaves the record without status, see sample_log.RECORD_STATUS_VALID)
+class BinaryOutput:
+    def __init__(self, path, ser):
+        from sample_log import SampleLogWriter
+
+        self.log = SampleLogWriter(path)
+        self.ser = ser
+
+    def write(self, module):
+        try:
+            status = read_status(ser=self.ser, id=module.id)
+        except CrcNok:
+            status = None
+        self.log.append(module.sample.timestamp, module.id, module.adc_results, status)
+
+    def close(self):
+        self.log.close()
+
+
+def print_stats(pack, start):
+    elapsed = time.monotonic() - start
+    nb_samples = sum(module.nb_samples for module in pack.modules.values())
+    nb_errors = sum(module.nb_errors for module in pack.modules.values())
+    print(
+        f"{elapsed:.1f}s: {nb_samples} samples ({nb_samples / elapsed:.1f}/s), "
+        f"{nb_errors} errors",
+        file=sys.stderr,
+    )
+
+
+def run(args):
+    ser = con_serial_port(args.port)
+    if ser is None:
+        return 1
+    output = None
+    try:
+        ids = find_modules(ser, args)
+        print(f"Sampling modules {ids} on {args.port}", file=sys.stderr)
+
+        from pack_monitor import PackMonitor
+
+        output = (
+            BinaryOutput(args.output, ser) if args.output else CsvOutput(sys.stdout)
+        )
+        with PackMonitor(ser, ids) as pack:
+            start = time.monotonic()
+            next_stats = start + STATS_PERIOD
+            try:
+                for modules in acquire(pack, args):
+                    for module in modules:
+                        output.write(module)
+                    now = time.monotonic()
+                    if args.duration is not None and now - start >= args.duration:
+                        break
+                    if args.stats and now >= next_stats:
+                        print_stats(pack, start)
+                        next_stats += STATS_PERIOD
+            except KeyboardInterrupt:
+                pass
+            if args.stats:
+                print_stats(pack, start)
+    except (NoSlaveFound, CrcNok, AdcTimeout) as error:
+        print(f"ERROR: {error}", file=sys.stderr)
+        return 1
+    finally:
+        if output is not None:
+            output.close()
+        disco_serial_port(ser)
+    return 0
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    set_trace_level(args.trace)
+    sys.exit(run(args))
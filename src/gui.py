@@ -2,35 +2,63 @@ from datetime import datetime
 import logging
 import os
 import re
+import time
 import tkinter as tk
 
 from pathlib import Path
 
 from serial_interface import (
+    AdcSession,
+    CrcNok,
+    AdcTimeout,
     OT_THR_TO_CELCIUS_LU_TABLE,
     OT_THR_TO_CELCIUS_LU_TABLE_REVERSE,
-    con_serial_port,
-    disco_serial_port,
+    TRACE_LEVELS,
+    get_trace_level,
+    set_trace_level,
     reset_slave,
     get_slave_id,
+    probe_slave,
     set_slave_id,
-    read_adc_meas,
+    read_adc_raw,
+    decode_adc_meas,
+    READ_FRAME_HEADER_SIZE,
     full_dump,
-    read_alerts,
-    read_faults,
-    read_ov_cells,
-    read_uv_cells,
-    get_ov_thr,
-    get_uv_thr,
+    read_status,
+    read_secu_thr,
     set_ov_thr,
     set_uv_thr,
-    get_ot_thr,
     set_ot_thr,
     clear_cuv_cov_faults,
 )
+from serial_worker import (
+    SerialWorker,
+)
+from pack_monitor import (
+    discover_chain,
+)
+from sample_log import (
+    SampleLogWriter,
+)
+from sample_ring import (
+    SampleRing,
+)
+from strip_chart import (
+    MeasurementsPlot,
+)
+from view_model import (
+    ViewModel,
+)
+from refresh_scheduler import (
+    RefreshScheduler,
+)
+from register_store import (
+    RegisterSnapshotStore,
+    render_deltas,
+    render_dump,
+)
 from tkinter import messagebox
 
-
 COM_PORT_PATTERN = r"^COM\d+$"
 
 ROOT_FOLDER = Path(__file__).parent.parent.resolve()
@@ -39,10 +67,18 @@ ALERT_REG_IMG = ROOT_FOLDER / "img" / "alert_status_register.png"
 FAULT_REG_IMG = ROOT_FOLDER / "img" / "fault_status_register.png"
 OT_THR_TABLE_IMG = ROOT_FOLDER / "img" / "ot_thr_meaning.png"
 
+# Log files are created at the first connection, named after its date and time
 LOG_FILE_FOLDER = ROOT_FOLDER / "log"
-TIMESTAMP = datetime.now().strftime("%Y%m%d_%H%M%S")
-LOG_FILE_NAME = f"log_{TIMESTAMP}.txt"
-LOG_FILE_PATH = LOG_FILE_FOLDER / LOG_FILE_NAME
+LOG_TIMESTAMP_FORMAT = "%Y%m%d_%H%M%S"
+
+# Auto refresh rates (Hz) per data class, and achieved rates display period
+AUTO_REFRESH_RATES_HZ = {
+    "V&T": 5,
+    "Status": 10,
+    "Thresholds": 1 / 60,
+    "ID": 1 / 60,
+}
+RATES_DISPLAY_PERIOD_MS = 1000
 
 
 def check_com_port_format(com_port_string):
@@ -58,21 +94,46 @@ class BMSMonitorApp:
         self.main = main
         self.main.title("Slave BMS Monitor - Tesla Model S ph.1, 2012/2016")
 
-        self.serial_con = None
+        # The serial port is owned by the worker thread, callbacks only submit jobs to it
+        self.worker = SerialWorker(main)
+        # Labels showing read values are updated through the view model (changes only)
+        self.view = ViewModel(main)
+        # Periodic refresh of the measurements, status, thresholds and ID once connected
+        self.scheduler = RefreshScheduler(main, self.worker)
+        # AdcSession of the auto refresh samples, kept open while the auto refresh runs.
+        # Only used from the serial worker thread (see auto_meas_job and close_meas_session).
+        self.meas_session = None
+        self.auto_refresh = None
+        self.rates_label = None
+        self.port_name = None
         self.com_port_sel = None
         self.com_port_input = None
         self.con_status = False
+        # Connection job submitted, until the board ID is found (or the connection fails)
+        self.connecting = False
 
         self.id = None
         self.id_sel = None
         self.id_input = None
         self.id_update_button = None
+        # Module selection among the chain modules found by "Scan chain"
+        self.chain_ids = []
+        self.module_sel = None
+        self.module_menu = None
 
         self.reset_button = None
 
         self.vbatt = None
         self.vcells = []
         self.temps = []
+        # Binary log of the ADC samples, created with the first sample
+        self.sample_log = None
+        # Raw ADC samples history per slave ID
+        self.history = {}
+        # Last read_status result per slave ID, recorded with the samples in the binary log
+        self.last_status = {}
+        # Memory dumps per (port, slave ID): the text log gets the first dump, then the changes
+        self.register_store = RegisterSnapshotStore()
 
         self.set_ov_thr_button = None
         self.set_uv_thr_button = None
@@ -120,23 +181,40 @@ class BMSMonitorApp:
         self.thresh_lock_checkbutton = None
         self.reset_lock_checkbutton = None
 
+        self.trace_level = None
+
         # COM_PORT, Reset, ID
         self.create_com_reset_id_frame(main)
         # Voltages, Temperatures
         self.create_measurements_frame(main)
         # Security thresholds (volt and temp)
         self.create_secu_thresholds_frame(main)
+        # Voltages and temperatures history plots
+        self.meas_plot = MeasurementsPlot(main, lambda: self.history.get(self.id))
+        self.meas_plot.frame.grid(row=1, column=0, columnspan=3, padx=10, pady=5)
         # Alerts and Faults status
         self.create_alerts_and_faults_frame(main)
         # Config locks
         self.create_locks_frame(main)
 
-        # Logging config
-        if not os.path.isdir(LOG_FILE_FOLDER):
-            os.mkdir(LOG_FILE_FOLDER)
+        # Logging config (the log file is only created at the first connection)
         self.logger = logging.getLogger(__name__)
         self.logger.setLevel(logging.DEBUG)
-        f_handler = logging.FileHandler(LOG_FILE_PATH)
+        self.log_timestamp = None
+
+        # Info windows and their images, loaded at the first display then reused
+        self.images = {}
+        self.info_windows = {}
+
+    def open_log_file(self):
+        if self.log_timestamp is not None:
+            return
+        self.log_timestamp = datetime.now().strftime(LOG_TIMESTAMP_FORMAT)
+        if not os.path.isdir(LOG_FILE_FOLDER):
+            os.mkdir(LOG_FILE_FOLDER)
+        f_handler = logging.FileHandler(
+            LOG_FILE_FOLDER / f"log_{self.log_timestamp}.txt"
+        )
         f_format = logging.Formatter(
             "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
         )
@@ -203,6 +281,13 @@ class BMSMonitorApp:
         self.id_input.grid(row=1, column=1, padx=5, pady=5)
         self.id_input.insert(0, "Enter ID here")
 
+        tk.Button(id_frame, text="Scan chain", command=self.scan_chain).grid(
+            row=2, column=0, padx=5, pady=5
+        )
+        self.module_sel = tk.StringVar(value="?")
+        self.module_menu = tk.OptionMenu(id_frame, self.module_sel, "?")
+        self.module_menu.grid(row=2, column=1, padx=5, pady=5)
+
     def create_measurements_frame(self, main):
         # Voltages, Temperatures
         measurements_frame = tk.Frame(main, width=100, height=100, bg="paleturquoise4")
@@ -283,6 +368,111 @@ class BMSMonitorApp:
             v_t_update_frame, text="Update V and T", command=self.update_meas
         ).grid(row=1, column=0, padx=5, pady=5)
 
+        # Auto refresh
+        self.auto_refresh = tk.IntVar(value=1)
+        tk.Checkbutton(
+            v_t_update_frame,
+            text="Auto refresh",
+            variable=self.auto_refresh,
+            command=self.switch_auto_refresh,
+        ).grid(row=1, column=1, padx=5, pady=5)
+        self.rates_label = tk.Label(v_t_update_frame, text="", justify=tk.LEFT)
+        self.rates_label.grid(row=2, column=0, columnspan=2, padx=5, pady=5)
+        self.create_refresh_tasks()
+
+    def create_refresh_tasks(self):
+        rates = AUTO_REFRESH_RATES_HZ
+        self.scheduler.add(
+            "V&T",
+            rates["V&T"],
+            self.auto_meas_job,
+            lambda res: self.on_meas(*res),
+        )
+        self.scheduler.add(
+            "Status",
+            rates["Status"],
+            self.status_job,
+            lambda res: self.on_status(*res),
+        )
+        self.scheduler.add(
+            "Thresholds",
+            rates["Thresholds"],
+            lambda ser: read_secu_thr(ser=ser, id=self.id),
+            self.show_secu_thr,
+        )
+        self.scheduler.add("ID", rates["ID"], self.check_id_job, self.on_id_checked)
+        self.main.after(RATES_DISPLAY_PERIOD_MS, self.show_achieved_rates)
+
+    # Serial worker side jobs of the auto refresh
+    def auto_meas_job(self, ser):
+        id = self.id
+        session = self.meas_session
+        if session is None or session.id != id or session.ser is not ser:
+            self.close_meas_session(ser)
+            session = self.meas_session = AdcSession(ser, id).open()
+        timestamp = time.time()
+        try:
+            rx_data = session.sample_raw()
+        except (CrcNok, AdcTimeout):
+            # The module may have been reset or replaced, the next sample opens a new session
+            self.close_meas_session(ser)
+            raise
+        return id, timestamp, rx_data
+
+    # Set back the module config changed by the auto refresh session, if any
+    def close_meas_session(self, ser):
+        session, self.meas_session = self.meas_session, None
+        if session is not None and session.ser is ser:
+            session.close()
+
+    # Jobs reading or changing the module config (thresholds, ID, reset, memory dump, manual
+    # measurement) run with the auto refresh session closed, the next auto sample opens it again
+    def submit_config_job(self, job, on_done=None, on_error=None):
+        def config_job(ser):
+            self.close_meas_session(ser)
+            return job(ser)
+
+        self.worker.submit(config_job, on_done, on_error)
+
+    def status_job(self, ser):
+        id = self.id
+        return id, read_status(ser=ser, id=id)
+
+    def check_id_job(self, ser):
+        id = self.id
+        if probe_slave(ser, id) is not None:
+            return id
+        # Current ID lost (e.g. slave reset), search it again
+        return get_slave_id(ser=ser)
+
+    def on_id_checked(self, id):
+        if id != self.id:
+            print(f"Slave ID changed from {self.id} to {id}")
+            self.on_reset_id(id)
+
+    def switch_auto_refresh(self):
+        if self.auto_refresh.get() == 1 and self.con_status:
+            self.scheduler.start()
+        else:
+            self.scheduler.stop()
+            self.worker.submit(self.close_meas_session)
+        print("Auto refresh: ", self.scheduler.running)
+
+    def show_achieved_rates(self):
+        self.main.after(RATES_DISPLAY_PERIOD_MS, self.show_achieved_rates)
+        if not self.scheduler.running:
+            self.view.update(self.rates_label, text="")
+            return
+        lines = []
+        for name, rate in self.scheduler.achieved_rates().items():
+            task = self.scheduler.tasks[name]
+            achieved = "-" if rate is None else f"{rate:.2f}"
+            line = f"{name}: {achieved}/{1 / task.period:.2f} Hz"
+            if task.backoff > 1:
+                line += f" (backoff x{task.backoff})"
+            lines.append(line)
+        self.view.update(self.rates_label, text="\n".join(lines))
+
     def create_secu_thresholds_frame(self, main):
         # Security thresholds (volt and temp)
         THR_BOX_WIDTH = 10
@@ -558,6 +748,27 @@ class BMSMonitorApp:
         )
         self.reset_lock_checkbutton.grid(row=0, column=0)
 
+        # Serial interface trace level
+        trace_frame = tk.Frame(lock_frame, width=20, height=20, bg="paleturquoise3")
+        trace_frame.grid(row=0, column=4, padx=5, pady=5)
+        current_level = get_trace_level()
+        self.trace_level = tk.StringVar(
+            value=next(
+                name for name, level in TRACE_LEVELS.items() if level == current_level
+            )
+        )
+        tk.Label(trace_frame, text="Trace:").grid(row=0, column=0)
+        tk.OptionMenu(
+            trace_frame,
+            self.trace_level,
+            *TRACE_LEVELS.keys(),
+            command=self.set_trace_level_ui,
+        ).grid(row=0, column=1)
+
+    def set_trace_level_ui(self, level_name):
+        set_trace_level(level_name)
+        print(f"Serial trace level: {level_name}")
+
     def lock_all(self):
         if self.global_lock.get() == 1:
             self.is_all_locked = True
@@ -645,11 +856,21 @@ class BMSMonitorApp:
         if self.is_reset_locked or self.is_all_locked:
             print("WARNING: Reset locked")
         else:
-            reset_slave(ser=self.serial_con, id=self.id)
-            print(f"Reset done for {self.id}")
+            id = self.id
+            self.submit_config_job(
+                lambda ser: reset_slave(ser=ser, id=id),
+                lambda _: print(f"Reset done for {id}"),
+                self.show_serial_error,
+            )
         # Board ID should have got back to 0
-        self.id = get_slave_id(ser=self.serial_con)
-        self.id_sel.config(text=f"ID: {self.id}")
+        self.worker.submit(
+            lambda ser: get_slave_id(ser=ser), self.on_reset_id, self.show_serial_error
+        )
+
+    def on_reset_id(self, id):
+        self.id = id
+        self.view.update(self.id_sel, text=f"ID: {self.id}")
+        self.module_sel.set(id)
         # Update ADC meas two times to let readings stabilizing
         self.update_meas()
         self.update_meas()
@@ -659,60 +880,129 @@ class BMSMonitorApp:
         self.update_secu_thr()
         self.log_full_memory()
 
-    def show_ot_thr_info(self):
+    def scan_chain(self):
+        if not self.con_status:
+            print("No board connected")
+            return
+        print("Scan chain modules")
+        self.worker.submit(
+            lambda ser: discover_chain(ser=ser),
+            self.on_chain_scanned,
+            self.show_serial_error,
+        )
+
+    def on_chain_scanned(self, ids):
+        self.chain_ids = ids
+        menu = self.module_menu["menu"]
+        menu.delete(0, tk.END)
+        for id in ids:
+            menu.add_command(label=id, command=lambda id=id: self.select_module(id))
+        if not ids:
+            messagebox.showwarning(
+                "WARNING", f"No module answered on {self.port_name}."
+            )
+        elif self.id not in ids:
+            self.select_module(ids[0])
+
+    def select_module(self, id):
+        self.module_sel.set(id)
+        if id == self.id:
+            return
+        print(f"Module {id} selected")
+        # Same refresh as after a reset: measurements, alerts, thresholds and memory dump
+        self.on_reset_id(id)
+
+    def show_serial_error(self, error):
+        messagebox.showwarning(
+            "WARNING", f"Communication with the BMS failed ({error!r})."
+        )
+
+    def load_image(self, path):
+        if path not in self.images:
+            self.images[path] = tk.PhotoImage(file=path)
+        return self.images[path]
+
+    # Info window showing a documentation screenshot, brought to front if already opened
+    def show_info_window(self, title, image_path):
+        info_window = self.info_windows.get(image_path)
+        if info_window is not None and info_window.winfo_exists():
+            info_window.deiconify()
+            info_window.lift()
+            return
         info_window = tk.Toplevel(self.main)
-        info_window.title("Over temperature threshold information")
-        doc_screenshot = tk.PhotoImage(file=OT_THR_TABLE_IMG)
-        image_label = tk.Label(info_window, image=doc_screenshot)
-        image_label.image = doc_screenshot
-        image_label.pack()
+        info_window.title(title)
+        tk.Label(info_window, image=self.load_image(image_path)).pack()
+        self.info_windows[image_path] = info_window
+
+    def show_ot_thr_info(self):
+        self.show_info_window(
+            "Over temperature threshold information", OT_THR_TABLE_IMG
+        )
         print("Show over temperature threshold meaning info")
 
     def show_alerts_info(self):
-        info_window = tk.Toplevel(self.main)
-        info_window.title("Alerts information")
-        resigster_screenshot = tk.PhotoImage(file=ALERT_REG_IMG)
-        image_label = tk.Label(info_window, image=resigster_screenshot)
-        image_label.image = resigster_screenshot
-        image_label.pack()
+        self.show_info_window("Alerts information", ALERT_REG_IMG)
         print("Show alerts info")
 
     def show_faults_info(self):
-        info_window = tk.Toplevel(self.main)
-        info_window.title("Faults information")
-        resigster_screenshot = tk.PhotoImage(file=FAULT_REG_IMG)
-        image_label = tk.Label(info_window, image=resigster_screenshot)
-        image_label.image = resigster_screenshot
-        image_label.pack()
+        self.show_info_window("Faults information", FAULT_REG_IMG)
         print("Show faults info")
 
     def log_full_memory(self):
         # Save a full memory dump in the log file
-        state_snapshot = ""
-        for i, byte in enumerate(full_dump(ser=self.serial_con, id=self.id)):
-            state_snapshot = state_snapshot + (
-                f"@{i}:{hex(byte)} " if byte > 15 else f"@{i}:{hex(byte)}  "
-            )
-        self.logger.info(
-            "Connection to %s, memory dump: %s", self.serial_con.name, state_snapshot
+        id = self.id
+        self.submit_config_job(
+            lambda ser: (time.time(), full_dump(ser=ser, id=id)),
+            lambda res: self.on_full_dump(id, *res),
+            self.show_serial_error,
         )
 
+    def on_full_dump(self, id, timestamp, dump):
+        deltas = self.register_store.add((self.port_name, id), timestamp, dump)
+        if deltas is None:
+            self.logger.info(
+                "Connection to %s, memory dump: %s", self.port_name, render_dump(dump)
+            )
+        elif deltas:
+            self.logger.info("Slave %s memory changes: %s", id, render_deltas(deltas))
+        else:
+            self.logger.debug("Slave %s memory unchanged", id)
+
+    # Another board may be connected to the port next time: its first dump must be logged in
+    # full, not as changes from the previous board dumps
+    def forget_port_dumps(self, port_name):
+        for module in [
+            key for key in self.register_store.modules if key[0] == port_name
+        ]:
+            self.register_store.clear(module)
+
     def disco_port(self):
         if not self.con_status:
             messagebox.showwarning("WARNING", f"Nothing connected actually.")
             self.con_status = False
             return False
-        if not disco_serial_port(self.serial_con):
+        self.scheduler.stop()
+        self.worker.submit(self.close_meas_session)
+        self.worker.disconnect(self.on_port_disco, self.show_serial_error)
+        return True
+
+    def on_port_disco(self, disconnected):
+        if not disconnected:
             messagebox.showwarning(
-                "WARNING", f"Failed to disconnect from {self.serial_con.port}."
+                "WARNING", f"Failed to disconnect from {self.port_name}."
             )
             return False
         self.com_port_sel.config(
             text="COM_PORT: DISCO", fg="brown", font=("Helvetica", 10, "bold")
         )
+        self.scheduler.stop()
         # Reset the board ID value
         self.id = ""
-        self.id_sel.config(text=f"ID: ?")
+        self.view.update(self.id_sel, text=f"ID: ?")
+        self.chain_ids = []
+        self.module_sel.set("?")
+        self.last_status = {}
+        self.forget_port_dumps(self.port_name)
         self.con_status = False
         return True
 
@@ -722,6 +1012,11 @@ class BMSMonitorApp:
                 "WARNING", f"One board is already connected, disconnect first."
             )
             return False
+        if self.connecting:
+            messagebox.showwarning(
+                "WARNING", f"Connection to {self.port_name} in progress."
+            )
+            return False
         port_name = self.com_port_input.get()
         if not check_com_port_format(port_name):
             messagebox.showwarning(
@@ -730,24 +1025,46 @@ class BMSMonitorApp:
             )
             self.con_status = False
             return False
-        self.serial_con = con_serial_port(port_name)
-        if self.serial_con == None:
+        self.port_name = port_name
+        self.connecting = True
+        self.worker.connect(port_name, self.on_port_set, self.on_port_set_error)
+        return True
+
+    def on_port_set_error(self, error):
+        self.connecting = False
+        self.show_serial_error(error)
+
+    def on_port_set(self, serial_con):
+        port_name = self.port_name
+        if serial_con == None:
             messagebox.showwarning("WARNING", f"Connection to {port_name} failed.")
             self.con_status = False
+            self.connecting = False
             return False
 
+        self.forget_port_dumps(port_name)
+        self.open_log_file()
         # Get the board ID to be able to address it
-        try:
-            self.id = get_slave_id(ser=self.serial_con)
-        except:
-            messagebox.showwarning(
-                "WARNING",
-                f"Issue heppened when trying to communicate with a BMS at {port_name} (e.g: no answer when reading ID).",
-            )
-            disco_serial_port(self.serial_con)
-            return False
-        self.id_sel.config(text=f"ID: {self.id}")
+        self.worker.submit(
+            lambda ser: get_slave_id(ser=ser), self.on_port_id, self.on_port_id_error
+        )
+        return True
+
+    def on_port_id_error(self, error):
+        self.connecting = False
+        messagebox.showwarning(
+            "WARNING",
+            f"Issue heppened when trying to communicate with a BMS at {self.port_name} (e.g: no answer when reading ID).",
+        )
+        self.worker.disconnect()
+
+    def on_port_id(self, id):
+        port_name = self.port_name
+        self.id = id
+        self.view.update(self.id_sel, text=f"ID: {self.id}")
+        self.module_sel.set(id)
         self.con_status = True
+        self.connecting = False
         self.com_port_sel.config(
             text=f"COM_PORT: {port_name} (CON)",
             fg="chartreuse4",
@@ -762,10 +1079,11 @@ class BMSMonitorApp:
         self.update_meas()
         # Update alerts and faults
         # TODO: Determine if we need to clear (clear_cuv_cov_faults) the Cell under and over voltage faults before updating it. It seems that once raised, they remain set.
-        # clear_cuv_cov_faults(ser=self.serial_con, id=self.id)
+        # clear_cuv_cov_faults(ser=ser, id=self.id)
         self.update_alerts_and_faults()
         # Update thresholds reading
         self.update_secu_thr()
+        self.switch_auto_refresh()
         return True
 
     def set_id(self):
@@ -776,40 +1094,84 @@ class BMSMonitorApp:
         if self.is_id_locked or self.is_all_locked:
             print("WARNING: ID locked")
         else:
-            if set_slave_id(ser=self.serial_con, old_id=self.id, new_id=id_in) != -1:
-                self.id_sel.config(text=f"ID: {(id_in if id_in!='' else '?')}")
-                self.logger.info("ID changed from %s to %s", self.id, id_in)
-                self.id = id_in
-                self.log_full_memory()
-            else:
-                messagebox.showwarning("WARNING", f"Setting ID to {id_in} failed.")
+            old_id = self.id
+            self.submit_config_job(
+                lambda ser: set_slave_id(ser=ser, old_id=old_id, new_id=id_in),
+                lambda res: self.on_id_set(res, id_in),
+                self.show_serial_error,
+            )
+
+    def on_id_set(self, res, id_in):
+        if res != -1:
+            self.view.update(self.id_sel, text=f"ID: {(id_in if id_in!='' else '?')}")
+            self.logger.info("ID changed from %s to %s", self.id, id_in)
+            self.id = id_in
+            self.log_full_memory()
+        else:
+            messagebox.showwarning("WARNING", f"Setting ID to {id_in} failed.")
 
     def update_meas(self):
         if not self.con_status:
             print("No board connected")
             return
         print("Update V & T")
+        id = self.id
+        self.submit_config_job(
+            lambda ser: (time.time(), read_adc_raw(ser=ser, id=id)),
+            lambda res: self.on_meas(id, *res),
+            self.show_serial_error,
+        )
+
+    def on_meas(self, id, timestamp, rx_data):
+        self.log_sample(timestamp, id, rx_data)
+        if id not in self.history:
+            self.history[id] = SampleRing()
+        self.history[id].append(timestamp, rx_data[READ_FRAME_HEADER_SIZE:-1])
+        self.show_meas(decode_adc_meas(rx_data))
+
+    def log_sample(self, timestamp, id, rx_data):
+        if self.sample_log is None:
+            self.open_log_file()
+            self.sample_log = SampleLogWriter(
+                LOG_FILE_FOLDER / f"samples_{self.log_timestamp}.bin"
+            )
+        self.sample_log.append(
+            timestamp,
+            id,
+            rx_data[READ_FRAME_HEADER_SIZE:-1],
+            self.last_status.get(id),
+        )
+        self.sample_log.flush()
+
+    def show_meas(self, meas_buff):
         # meas_buff = [GPAI, Vcell1, Vcell2, Vcell3, Vcell4, Vcell5, Vcell6, Temp1, Temp2]
-        meas_buff = read_adc_meas(ser=self.serial_con, id=self.id)
-        self.vbatt.config(text=meas_buff[0])
+        self.view.update(self.vbatt, text=meas_buff[0])
         for i, vcell in enumerate(self.vcells):
-            vcell.config(text=meas_buff[1 + i])
+            self.view.update(vcell, text=meas_buff[1 + i])
         for i, temp in enumerate(self.temps):
-            temp.config(text=meas_buff[7 + i])
+            self.view.update(temp, text=meas_buff[7 + i])
 
     def update_secu_thr(self):
         # TODO: Display the information when security thresholds are disabled
         print("Update security thresholds")
-        ov_thr = get_ov_thr(ser=self.serial_con, id=self.id)
-        uv_thr = get_uv_thr(ser=self.serial_con, id=self.id)
-        ot1_thr, ot2_thr = get_ot_thr(ser=self.serial_con, id=self.id)
-        self.ov_thr_sel.config(text=f"{ov_thr} V")
-        self.uv_thr_sel.config(text=f"{uv_thr} V")
-        self.ot1_thr_sel.config(
-            text=f"{ot1_thr} ({OT_THR_TO_CELCIUS_LU_TABLE[ot1_thr]}degC)"
+        id = self.id
+        self.worker.submit(
+            lambda ser: read_secu_thr(ser=ser, id=id),
+            self.show_secu_thr,
+            self.show_serial_error,
+        )
+
+    def show_secu_thr(self, thresholds):
+        ov_thr, uv_thr, (ot1_thr, ot2_thr) = thresholds
+        self.view.update(self.ov_thr_sel, text=f"{ov_thr} V")
+        self.view.update(self.uv_thr_sel, text=f"{uv_thr} V")
+        self.view.update(
+            self.ot1_thr_sel,
+            text=f"{ot1_thr} ({OT_THR_TO_CELCIUS_LU_TABLE[ot1_thr]}degC)",
         )
-        self.ot2_thr_sel.config(
-            text=f"{ot2_thr} ({OT_THR_TO_CELCIUS_LU_TABLE[ot2_thr]}degC)"
+        self.view.update(
+            self.ot2_thr_sel,
+            text=f"{ot2_thr} ({OT_THR_TO_CELCIUS_LU_TABLE[ot2_thr]}degC)",
         )
 
     def set_ov_thr_ui(self):
@@ -821,16 +1183,24 @@ class BMSMonitorApp:
             return
         else:
             ovt_in = float(self.ov_thr_input.get())
-            set_ov_thr(ser=self.serial_con, id=self.id, new_ov_thr_v=ovt_in)
-            self.logger.info(
-                "Overvoltage threshold changed for slave %s from %s to %s V",
-                self.id,
-                self.ov_thr_sel.cget("text"),
-                ovt_in,
+            id = self.id
+            self.submit_config_job(
+                lambda ser: set_ov_thr(ser=ser, id=id, new_ov_thr_v=ovt_in),
+                lambda _: self.on_ov_thr_set(ovt_in),
+                self.show_serial_error,
             )
-            self.ov_thr_sel.config(text=f"{ovt_in} V")
-            self.log_full_memory()
-            print("Set OVT done")
+
+    def on_ov_thr_set(self, ovt_in):
+        self.logger.info(
+            "Overvoltage threshold changed for slave %s from %s to %s V",
+            self.id,
+            self.view.get(self.ov_thr_sel),
+            ovt_in,
+        )
+        self.view.update(self.ov_thr_sel, text=f"{ovt_in} V")
+        self.log_full_memory()
+        self.scheduler.trigger("Thresholds")
+        print("Set OVT done")
 
     def set_uv_thr_ui(self):
         if not self.con_status:
@@ -841,16 +1211,24 @@ class BMSMonitorApp:
             return
         else:
             uvt_in = float(self.uv_thr_input.get())
-            set_uv_thr(ser=self.serial_con, id=self.id, new_uv_thr_v=uvt_in)
-            self.logger.info(
-                "Undervoltage threshold changed for slave %s from %s to %s V",
-                self.id,
-                self.uv_thr_sel.cget("text"),
-                uvt_in,
+            id = self.id
+            self.submit_config_job(
+                lambda ser: set_uv_thr(ser=ser, id=id, new_uv_thr_v=uvt_in),
+                lambda _: self.on_uv_thr_set(uvt_in),
+                self.show_serial_error,
             )
-            self.uv_thr_sel.config(text=f"{uvt_in} V")
-            self.log_full_memory()
-            print("Set UVT done")
+
+    def on_uv_thr_set(self, uvt_in):
+        self.logger.info(
+            "Undervoltage threshold changed for slave %s from %s to %s V",
+            self.id,
+            self.view.get(self.uv_thr_sel),
+            uvt_in,
+        )
+        self.view.update(self.uv_thr_sel, text=f"{uvt_in} V")
+        self.log_full_memory()
+        self.scheduler.trigger("Thresholds")
+        print("Set UVT done")
 
     def set_ot1_thr_ui(self):
         if not self.con_status:
@@ -866,23 +1244,32 @@ class BMSMonitorApp:
                     f"Valid temperatures are (degC): {[temp for temp in OT_THR_TO_CELCIUS_LU_TABLE_REVERSE.keys()]}",
                 )
                 return
-            set_ot_thr(
-                ser=self.serial_con, id=self.id, new_ot_thr_deg=ot1t_in, temp_id=1
-            )
-            self.logger.info(
-                "Over temperature 1 threshold changed for slave %s from %s to %s (%sdegC)",
-                self.id,
-                self.ot1_thr_sel.cget("text"),
-                OT_THR_TO_CELCIUS_LU_TABLE_REVERSE[ot1t_in],
-                ot1t_in,
-            )
-            self.ot1_thr_sel.config(
-                text=f"{OT_THR_TO_CELCIUS_LU_TABLE_REVERSE[ot1t_in]} ({ot1t_in}degC)"
+            id = self.id
+            self.submit_config_job(
+                lambda ser: set_ot_thr(
+                    ser=ser, id=id, new_ot_thr_deg=ot1t_in, temp_id=1
+                ),
+                lambda _: self.on_ot1_thr_set(ot1t_in),
+                self.show_serial_error,
             )
-            self.ot1_thr_input.delete(0, tk.END)
-            self.ot1_thr_input.insert(0, "Enter OT1_THR")
-            self.log_full_memory()
-            print("Set OT1T done")
+
+    def on_ot1_thr_set(self, ot1t_in):
+        self.logger.info(
+            "Over temperature 1 threshold changed for slave %s from %s to %s (%sdegC)",
+            self.id,
+            self.view.get(self.ot1_thr_sel),
+            OT_THR_TO_CELCIUS_LU_TABLE_REVERSE[ot1t_in],
+            ot1t_in,
+        )
+        self.view.update(
+            self.ot1_thr_sel,
+            text=f"{OT_THR_TO_CELCIUS_LU_TABLE_REVERSE[ot1t_in]} ({ot1t_in}degC)",
+        )
+        self.ot1_thr_input.delete(0, tk.END)
+        self.ot1_thr_input.insert(0, "Enter OT1_THR")
+        self.log_full_memory()
+        self.scheduler.trigger("Thresholds")
+        print("Set OT1T done")
 
     def set_ot2_thr_ui(self):
         if not self.con_status:
@@ -898,60 +1285,60 @@ class BMSMonitorApp:
                     f"Valid temperatures are (degC): {[temp for temp in OT_THR_TO_CELCIUS_LU_TABLE_REVERSE.keys()]}",
                 )
                 return
-            set_ot_thr(
-                ser=self.serial_con, id=self.id, new_ot_thr_deg=ot2t_in, temp_id=2
-            )
-            self.logger.info(
-                "Over temperature 2 threshold changed for slave %s from %s to %s (%sdegC)",
-                self.id,
-                self.ot2_thr_sel.cget("text"),
-                OT_THR_TO_CELCIUS_LU_TABLE_REVERSE[ot2t_in],
-                ot2t_in,
-            )
-            self.ot2_thr_sel.config(
-                text=f"{OT_THR_TO_CELCIUS_LU_TABLE_REVERSE[ot2t_in]} ({ot2t_in}degC)"
+            id = self.id
+            self.submit_config_job(
+                lambda ser: set_ot_thr(
+                    ser=ser, id=id, new_ot_thr_deg=ot2t_in, temp_id=2
+                ),
+                lambda _: self.on_ot2_thr_set(ot2t_in),
+                self.show_serial_error,
             )
-            self.ot2_thr_input.delete(0, tk.END)
-            self.ot2_thr_input.insert(0, "Enter OT2_THR")
-            self.log_full_memory()
-            print("Set OT2T done")
+
+    def on_ot2_thr_set(self, ot2t_in):
+        self.logger.info(
+            "Over temperature 2 threshold changed for slave %s from %s to %s (%sdegC)",
+            self.id,
+            self.view.get(self.ot2_thr_sel),
+            OT_THR_TO_CELCIUS_LU_TABLE_REVERSE[ot2t_in],
+            ot2t_in,
+        )
+        self.view.update(
+            self.ot2_thr_sel,
+            text=f"{OT_THR_TO_CELCIUS_LU_TABLE_REVERSE[ot2t_in]} ({ot2t_in}degC)",
+        )
+        self.ot2_thr_input.delete(0, tk.END)
+        self.ot2_thr_input.insert(0, "Enter OT2_THR")
+        self.log_full_memory()
+        self.scheduler.trigger("Thresholds")
+        print("Set OT2T done")
 
     def update_alerts_and_faults(self):
         if not self.con_status:
             print("No board connected")
             return
         print("update Alerts & Faults")
-        alerts = read_alerts(ser=self.serial_con, id=self.id)
-        faults = read_faults(ser=self.serial_con, id=self.id)
-        ov_cells = read_ov_cells(ser=self.serial_con, id=self.id)
-        uv_cells = read_uv_cells(ser=self.serial_con, id=self.id)
-
-        self.alerts_val[0].config(text=(alerts & 0x80) >> 7)
-        self.alerts_val[1].config(text=(alerts & 0x40) >> 6)
-        self.alerts_val[2].config(text=(alerts & 0x20) >> 5)
-        self.alerts_val[3].config(text=(alerts & 0x10) >> 4)
-        self.alerts_val[4].config(text=(alerts & 0x08) >> 3)
-        self.alerts_val[5].config(text=(alerts & 0x04) >> 2)
-        self.alerts_val[6].config(text=(alerts & 0x02) >> 1)
-        self.alerts_val[7].config(text=alerts & 0x01)
-
-        self.faults_val[2].config(text=(faults & 0x20) >> 5)
-        self.faults_val[3].config(text=(faults & 0x10) >> 4)
-        self.faults_val[4].config(text=(faults & 0x08) >> 3)
-        self.faults_val[5].config(text=(faults & 0x04) >> 2)
-        self.faults_val[6].config(text=(faults & 0x02) >> 1)
-        self.faults_val[7].config(text=faults & 0x01)
-
-        self.ov_cells_val[0].config(text=ov_cells & 0x01)
-        self.ov_cells_val[1].config(text=(ov_cells & 0x02) >> 1)
-        self.ov_cells_val[2].config(text=(ov_cells & 0x04) >> 2)
-        self.ov_cells_val[3].config(text=(ov_cells & 0x08) >> 3)
-        self.ov_cells_val[4].config(text=(ov_cells & 0x10) >> 4)
-        self.ov_cells_val[5].config(text=(ov_cells & 0x20) >> 5)
-
-        self.uv_cells_val[0].config(text=uv_cells & 0x01)
-        self.uv_cells_val[1].config(text=(uv_cells & 0x02) >> 1)
-        self.uv_cells_val[2].config(text=(uv_cells & 0x04) >> 2)
-        self.uv_cells_val[3].config(text=(uv_cells & 0x08) >> 3)
-        self.uv_cells_val[4].config(text=(uv_cells & 0x10) >> 4)
-        self.uv_cells_val[5].config(text=(uv_cells & 0x20) >> 5)
+        id = self.id
+        self.worker.submit(
+            lambda ser: (id, read_status(ser=ser, id=id)),
+            lambda res: self.on_status(*res),
+            self.show_serial_error,
+        )
+
+    def on_status(self, id, status):
+        self.last_status[id] = status
+        self.show_alerts_and_faults(status)
+
+    def show_alerts_and_faults(self, status):
+        alerts, faults, ov_cells, uv_cells = status
+
+        # Alerts and faults labels are ordered from bit 7 to bit 0 (faults bits 7 and 6 unused)
+        for i, alert_val in enumerate(self.alerts_val):
+            self.view.update(alert_val, text=(alerts >> (7 - i)) & 0x01)
+        for i, fault_val in enumerate(self.faults_val[2:], start=2):
+            self.view.update(fault_val, text=(faults >> (7 - i)) & 0x01)
+        # Cells labels are ordered from cell 1 (bit 0) to cell 6 (bit 5)
+        for i, (ov_cell_val, uv_cell_val) in enumerate(
+            zip(self.ov_cells_val, self.uv_cells_val)
+        ):
+            self.view.update(ov_cell_val, text=(ov_cells >> i) & 0x01)
+            self.view.update(uv_cell_val, text=(uv_cells >> i) & 0x01)
@@ -1,10 +1,41 @@
+import time
+
+# Startup time is measured from here (before the heavy imports) to the first window display
+STARTUP_START = time.perf_counter()
+STARTUP_BUDGET_MS = 500
+
+import argparse
 import tkinter as tk
 
 from gui import (
     BMSMonitorApp,
 )
+from serial_interface import (
+    TRACE_LEVELS,
+    set_trace_level,
+)
+
+
+def report_startup_time():
+    startup_ms = (time.perf_counter() - STARTUP_START) * 1000
+    if startup_ms > STARTUP_BUDGET_MS:
+        print(f"Startup: {startup_ms:.0f} ms (budget: {STARTUP_BUDGET_MS} ms)")
+    else:
+        print(f"Startup: {startup_ms:.0f} ms")
+
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="TeslaMS1 BMS serial tool")
+    parser.add_argument(
+        "--trace",
+        choices=TRACE_LEVELS.keys(),
+        default="info",
+        help="serial interface trace level (default: info)",
+    )
+    args = parser.parse_args()
+    set_trace_level(args.trace)
+
     root = tk.Tk()
     app = BMSMonitorApp(root)
+    root.after_idle(report_startup_time)
     root.mainloop()
@@ -0,0 +1,361 @@
+import time
+
+from collections import namedtuple
+
+from serial_interface import (
+    ADC_CONFIG_FULL_MEAS,
+    ADC_NB_MEAS,
+    ADC_POLL_MAX,
+    ADC_POLL_PERIOD,
+    ADC_RES_ADDR,
+    ADC_START_ADDR,
+    ADDRESS_CONTROL_ADDR,
+    BROADCAST_ADDR,
+    READ_FRAME_HEADER_SIZE,
+    TRACE_FRAMES,
+    TRACE_INFO,
+    AdcSample,
+    AdcSession,
+    AdcTimeout,
+    Bq76Batch,
+    CrcNok,
+    NoSlaveFound,
+    _print,
+    adc_conv_time,
+    adc_meas_row,
+    check_slave_id_echo,
+    decode_adc_frames,
+    decode_adc_meas,
+    forget_port_shadows,
+    get_probe_timeout,
+    get_trace_level,
+    paced,
+    probe_slave,
+    reset_slave,
+    write_bq76,
+)
+from sample_ring import (
+    SAMPLE_RING_SIZE,
+    SampleRing,
+)
+
+# A Tesla Model S pack chains 16 modules (96 cells) on the same UART
+PACK_MAX_MODULES = 16
+NB_CELLS_PER_MODULE = 6
+# ID given to the first module of the chain by assign_chain_ids
+CHAIN_FIRST_ID = 1
+# ID of the modules without address assigned (after reset)
+UNASSIGNED_ID = 0x00
+# Aggregate rate (module reads per second, all modules together) of PackMonitor.poll
+PACK_POLL_RATE_HZ = 16
+
+
+# Non destructive chain discovery: probe every ID with the probe timeout (see set_probe_timeout).
+# Returns the list of IDs answering, in increasing order (UNASSIGNED_ID included when a module
+# has no address yet).
+def discover_chain(*, ser, max_id=BROADCAST_ADDR):
+    _print("Searching for chain modules...")
+    forget_port_shadows(getattr(ser, "port", None))
+    timeout_backup = ser.timeout
+    ser.timeout = get_probe_timeout()
+    ids = []
+    try:
+        for tested_id in range(0x00, max_id):
+            if get_trace_level() >= TRACE_FRAMES:
+                _print(f"Testing ID {tested_id}")
+            if probe_slave(ser, tested_id) is not None:
+                ids.append(tested_id)
+    finally:
+        ser.timeout = timeout_backup
+    if get_trace_level() >= TRACE_INFO:
+        _print(f"Chain modules IDs: {ids}\n")
+    return ids
+
+
+# Address assignment of the whole chain: all the modules are reset with a broadcast write (they
+# all get back to UNASSIGNED_ID), then the first module still at UNASSIGNED_ID gets the next ID,
+# from CHAIN_FIRST_ID, until no module answers at UNASSIGNED_ID anymore.
+# Returns the list of assigned IDs.
+def assign_chain_ids(*, ser, max_modules=PACK_MAX_MODULES):
+    reset_slave(ser=ser, id=BROADCAST_ADDR)
+    ids = []
+    timeout_backup = ser.timeout
+    ser.timeout = get_probe_timeout()
+    try:
+        for new_id in range(CHAIN_FIRST_ID, CHAIN_FIRST_ID + max_modules):
+            if probe_slave(ser, UNASSIGNED_ID) is None:
+                break
+            rx_data = write_bq76(
+                ser, UNASSIGNED_ID, ADDRESS_CONTROL_ADDR, 0x80 | new_id
+            )
+            if check_slave_id_echo(rx_data, UNASSIGNED_ID, new_id) == -1:
+                break
+            if probe_slave(ser, new_id) is None:
+                if get_trace_level() >= TRACE_INFO:
+                    _print(
+                        f"ERROR: module {new_id} does not answer after ID assignment.\n"
+                    )
+                break
+            ids.append(new_id)
+    finally:
+        ser.timeout = timeout_backup
+    if get_trace_level() >= TRACE_INFO:
+        _print(f"Chain IDs assigned: {ids}\n")
+    return ids
+
+
+# Chain IDs for pack monitoring: the IDs already assigned are kept when every module answers
+# with an address, otherwise (or when assign is True) the whole chain is addressed again.
+def enumerate_chain(*, ser, assign=False, max_modules=PACK_MAX_MODULES):
+    ids = [] if assign else discover_chain(ser=ser)
+    if not ids or UNASSIGNED_ID in ids:
+        ids = assign_chain_ids(ser=ser, max_modules=max_modules)
+    if not ids:
+        raise NoSlaveFound(f"No BMS module answered on {getattr(ser, 'port', None)}.")
+    return ids[:max_modules]
+
+
+# Pack wide ADC snapshot (see snapshot_adc):
+# - monotonic, timestamp: time.monotonic() and time.time() at the broadcast ADC_START write
+# - conv_latency: from the broadcast write to the last completed module read (seconds)
+# - meas: {id: decoded measurements} of the modules read (see decode_adc_meas)
+# - errors: {id: exception} of the modules that could not be read (CrcNok, AdcTimeout)
+# - results: {id: raw ADC results bytes} of the modules read
+PackSnapshot = namedtuple(
+    "PackSnapshot",
+    ["monotonic", "timestamp", "conv_latency", "meas", "errors", "results"],
+)
+
+
+# Time aligned acquisition of all the modules: one broadcast ADC_START write starts the
+# conversion of every module at the same instant, so the whole pack costs a single conversion
+# time. The ADC_START status and the ADC_NB_MEAS results bytes of every module are then read in
+# one pipelined exchange, the modules still converting (or with a bad answer) are read again,
+# at most ADC_POLL_MAX times. Retries use one exchange per module: a module not answering only
+# echoes the requests, which shifts all the following answers of a pipelined exchange.
+# The modules ADC_CONFIG and IO_CONFIG must already be set for the measurement (AdcSession).
+def snapshot_adc(*, ser, ids, adc_config=ADC_CONFIG_FULL_MEAS):
+    monotonic = time.monotonic()
+    timestamp = time.time()
+    start = time.perf_counter()
+    write_bq76(ser, BROADCAST_ADDR, ADC_START_ADDR, 0x1)
+    remaining = start + adc_conv_time(adc_config) - time.perf_counter()
+    if remaining > 0:
+        time.sleep(remaining)
+
+    results_blocks = {}
+    errors = {}
+    pending = list(ids)
+    for poll in range(1, ADC_POLL_MAX + 1):
+        groups = [pending] if poll == 1 else [[id] for id in pending]
+        results = []
+        for group in groups:
+            batch = Bq76Batch(ser)
+            for id in group:
+                batch.read(id, ADC_START_ADDR, 0x1)
+                batch.read(id, ADC_RES_ADDR, ADC_NB_MEAS)
+            results += batch.run()
+        ongoing = []
+        for id, status, res in zip(pending, results[0::2], results[1::2]):
+            if not (status.crc_ok and res.crc_ok):
+                errors[id] = CrcNok(f"CRC NOK: ADC snapshot of slave {id}")
+                ongoing.append(id)
+            elif status.data[0] & 0x1:
+                errors[id] = AdcTimeout(
+                    f"ERROR: ADC meas of slave {id} still ongoing after {poll} polls"
+                )
+                ongoing.append(id)
+            else:
+                errors.pop(id, None)
+                results_blocks[id] = res.data
+        pending = ongoing
+        if not pending:
+            break
+        time.sleep(ADC_POLL_PERIOD)
+    conv_latency = time.perf_counter() - start
+
+    # All the modules results decoded in one vectorized pass
+    meas = {}
+    if results_blocks:
+        decoded = decode_adc_frames(list(results_blocks.values()))
+        for row, id in enumerate(results_blocks):
+            meas[id] = adc_meas_row(decoded, row)
+    if get_trace_level() >= TRACE_INFO:
+        _print(
+            f"ADC snapshot of {len(meas)}/{len(ids)} modules in {conv_latency * 1000:.3f}ms.\n"
+        )
+    return PackSnapshot(
+        monotonic, timestamp, conv_latency, meas, errors, results_blocks
+    )
+
+
+# Last data read from one module of the chain, and the history of its raw samples
+class ModuleData:
+    def __init__(self, id, history_size=SAMPLE_RING_SIZE):
+        self.id = id
+        # Last AdcSample read from the module (see serial_interface.stream_adc)
+        self.sample = None
+        # Raw ADC results bytes of the last sample
+        self.adc_results = None
+        self.history = SampleRing(history_size)
+        self.nb_samples = 0
+        self.nb_errors = 0
+        self.last_error = None
+
+    # adc_results: raw ADC results bytes the sample was decoded from
+    def update(self, sample, adc_results):
+        self.sample = sample
+        self.adc_results = adc_results
+        self.nb_samples += 1
+        self.history.append(sample.timestamp, adc_results)
+
+    def fail(self, error):
+        self.nb_errors += 1
+        self.last_error = error
+
+    # meas = [GPAI, Vcell1, Vcell2, Vcell3, Vcell4, Vcell5, Vcell6, Temp1, Temp2]
+    @property
+    def meas(self):
+        return None if self.sample is None else self.sample.meas
+
+    @property
+    def vbatt(self):
+        return None if self.sample is None else self.sample.meas[0]
+
+    @property
+    def vcells(self):
+        return None if self.sample is None else self.sample.meas[1:7]
+
+    @property
+    def temps(self):
+        return None if self.sample is None else self.sample.meas[7:9]
+
+
+# Round robin acquisition over the modules of a chain. Each module has its own AdcSession opened
+# for the whole monitoring, so a module read only costs its conversion and results read.
+#   with PackMonitor(ser, enumerate_chain(ser=ser)) as pack:
+#       for module in pack.poll(rate_hz=PACK_POLL_RATE_HZ):
+#           ...
+class PackMonitor:
+    def __init__(self, ser, ids):
+        self.ser = ser
+        self.modules = {id: ModuleData(id) for id in ids}
+        self._sessions = {}
+        self._next = 0
+        self._seq = 0
+
+    @property
+    def ids(self):
+        return list(self.modules)
+
+    @property
+    def nb_cells(self):
+        return NB_CELLS_PER_MODULE * len(self.modules)
+
+    # A module failing to open its session (CrcNok, AdcTimeout) is counted in its ModuleData as a
+    # failed read, its session is opened again on its next read. Any other error closes the
+    # sessions already opened, the modules are not left with the measurement config.
+    def open(self):
+        try:
+            for module in self.modules.values():
+                self._session(module)
+        except BaseException:
+            self.close()
+            raise
+        return self
+
+    def close(self):
+        for session in self._sessions.values():
+            session.close()
+        self._sessions = {}
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # Opened AdcSession of the module, None if it could not be opened (module.fail called)
+    def _session(self, module):
+        session = self._sessions.get(module.id)
+        if session is None:
+            try:
+                session = AdcSession(self.ser, module.id).open()
+            except (CrcNok, AdcTimeout) as error:
+                module.fail(error)
+                return None
+            self._sessions[module.id] = session
+        return session
+
+    # Read the next module of the round robin, returns its ModuleData.
+    # A module failing (CrcNok, AdcTimeout) is counted in its ModuleData, the others keep going.
+    def poll_once(self, deadline=None, missed=0):
+        ids = self.ids
+        module = self.modules[ids[self._next]]
+        self._next = (self._next + 1) % len(ids)
+        if deadline is None:
+            deadline = time.monotonic()
+        timestamp = time.time()
+        session = self._session(module)
+        if session is not None:
+            try:
+                rx_data = session.sample_raw()
+            except (CrcNok, AdcTimeout) as error:
+                module.fail(error)
+            else:
+                meas = decode_adc_meas(rx_data)
+                module.update(
+                    AdcSample(
+                        self._seq,
+                        deadline,
+                        timestamp,
+                        meas,
+                        session.conv_latency,
+                        missed,
+                    ),
+                    rx_data[READ_FRAME_HEADER_SIZE:-1],
+                )
+        self._seq += 1
+        return module
+
+    # Time aligned read of all the modules (see snapshot_adc), the ModuleData are updated with
+    # the snapshot results. Returns the PackSnapshot, the modules whose session could not be
+    # opened are not read and are reported in its errors.
+    def snapshot(self):
+        ids = []
+        open_errors = {}
+        for id, module in self.modules.items():
+            if self._session(module) is None:
+                open_errors[id] = module.last_error
+            else:
+                ids.append(id)
+        snapshot = snapshot_adc(ser=self.ser, ids=ids)
+        for id in ids:
+            module = self.modules[id]
+            if id in snapshot.meas:
+                module.update(
+                    AdcSample(
+                        self._seq,
+                        snapshot.monotonic,
+                        snapshot.timestamp,
+                        snapshot.meas[id],
+                        snapshot.conv_latency,
+                        0,
+                    ),
+                    snapshot.results[id],
+                )
+            else:
+                module.fail(snapshot.errors[id])
+        self._seq += 1
+        snapshot.errors.update(open_errors)
+        return snapshot
+
+    # Read the modules one after the other at rate_hz module reads per second (each module is
+    # read every len(ids) / rate_hz seconds), on absolute deadlines as serial_interface.stream_adc.
+    # Yields the ModuleData of the module just read, stops after count reads (never if None).
+    # Without rate_hz (None) the modules are read as fast as the link allows.
+    def poll(self, rate_hz=PACK_POLL_RATE_HZ, count=None):
+        for deadline, missed in paced(rate_hz, count):
+            if missed and get_trace_level() >= TRACE_INFO:
+                _print(f"Pack poll: {missed} deadline(s) missed.")
+            yield self.poll_once(deadline, missed)
@@ -0,0 +1,129 @@
+import time
+
+from collections import deque
+
+SCHEDULER_TICK_MS = 20
+# Period multiplier applied when a task can't keep up (and divided back once it does again)
+BACKOFF_FACTOR = 2
+BACKOFF_MAX = 16
+# Achieved rates are computed over the last RATE_NB_SAMPLES completions
+RATE_NB_SAMPLES = 10
+
+
+class RefreshTask:
+    def __init__(self, name, rate_hz, job, on_done, on_error=None):
+        self.name = name
+        self.period = 1 / rate_hz
+        # job(ser) runs in the serial worker, on_done(result) / on_error(error) in the Tk thread
+        self.job = job
+        self.on_done = on_done
+        self.on_error = on_error
+        self.enabled = True
+        self.backoff = 1
+        self.next_due = 0.0
+        self.in_flight = False
+        self.submitted_at = None
+        self.completions = deque(maxlen=RATE_NB_SAMPLES)
+        self.nb_errors = 0
+
+    @property
+    def effective_period(self):
+        return self.period * self.backoff
+
+    # Completions per second over the last RATE_NB_SAMPLES completions, None until there are 2
+    @property
+    def achieved_rate(self):
+        if len(self.completions) < 2:
+            return None
+        return (len(self.completions) - 1) / (
+            self.completions[-1] - self.completions[0]
+        )
+
+
+# Periodic refresh of several data classes, each at its own rate, through the SerialWorker.
+# A task is submitted when it is due and its previous job is done (never queued twice). When a
+# job takes longer than the task period, fails, or the worker queue is late, the task period is
+# multiplied by BACKOFF_FACTOR (up to BACKOFF_MAX), and divided back when it keeps up again.
+#   scheduler = RefreshScheduler(root, worker)
+#   scheduler.add("meas", 5, lambda ser: read_adc_meas(ser=ser, id=id), show_meas)
+#   scheduler.start()
+class RefreshScheduler:
+    def __init__(self, root, worker):
+        self.root = root
+        self.worker = worker
+        self.tasks = {}
+        self._after_id = None
+
+    def add(self, name, rate_hz, job, on_done, on_error=None):
+        self.tasks[name] = RefreshTask(name, rate_hz, job, on_done, on_error)
+        return self.tasks[name]
+
+    def set_rate(self, name, rate_hz):
+        self.tasks[name].period = 1 / rate_hz
+
+    # Refresh the task at the next tick, whatever its period (e.g. value changed)
+    def trigger(self, name):
+        self.tasks[name].next_due = 0.0
+
+    @property
+    def running(self):
+        return self._after_id is not None
+
+    def start(self):
+        if self.running:
+            return
+        now = time.monotonic()
+        for task in self.tasks.values():
+            task.backoff = 1
+            task.next_due = now
+            task.completions.clear()
+        self._after_id = self.root.after(SCHEDULER_TICK_MS, self._tick)
+
+    def stop(self):
+        if self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+            self._after_id = None
+
+    # {name: achieved rate in Hz (None if not known yet)}
+    def achieved_rates(self):
+        return {name: task.achieved_rate for name, task in self.tasks.items()}
+
+    def _tick(self):
+        self._after_id = self.root.after(SCHEDULER_TICK_MS, self._tick)
+        now = time.monotonic()
+        for task in self.tasks.values():
+            if not task.enabled or task.in_flight or now < task.next_due:
+                continue
+            # Jobs from the other tasks (or manual updates) still queued: the link is late
+            if self.worker.pending() > len(self.tasks):
+                self._back_off(task)
+            task.next_due = max(task.next_due + task.effective_period, now)
+            task.in_flight = True
+            task.submitted_at = now
+            self.worker.submit(
+                task.job,
+                lambda result, task=task: self._done(task, result),
+                lambda error, task=task: self._failed(task, error),
+            )
+
+    def _back_off(self, task):
+        task.backoff = min(task.backoff * BACKOFF_FACTOR, BACKOFF_MAX)
+
+    def _done(self, task, result):
+        now = time.monotonic()
+        task.in_flight = False
+        task.completions.append(now)
+        if now - task.submitted_at > task.effective_period:
+            self._back_off(task)
+        elif task.backoff > 1:
+            task.backoff = max(task.backoff // BACKOFF_FACTOR, 1)
+        if self.running:
+            task.on_done(result)
+
+    def _failed(self, task, error):
+        task.in_flight = False
+        task.nb_errors += 1
+        self._back_off(task)
+        task.next_due = time.monotonic() + task.effective_period
+        if self.running and task.on_error is not None:
+            task.on_error(error)
@@ -0,0 +1,88 @@
+from bisect import bisect_right
+from collections import namedtuple
+
+# Register change between two dumps of the same module
+RegisterDelta = namedtuple("RegisterDelta", ["addr", "old", "new"])
+
+
+# Dumps history of one module: the first full dump is kept raw, every later dump only as the
+# list of registers changed since the previous one.
+class ModuleRegisterHistory:
+    def __init__(self, timestamp, dump):
+        self.base_timestamp = timestamp
+        self.base = bytes(dump)
+        self.current = bytearray(dump)
+        # (timestamp, (RegisterDelta, ...)) in time order, empty tuples are not stored
+        self.deltas = []
+        self._timestamps = []
+
+    def add(self, timestamp, dump):
+        deltas = tuple(
+            RegisterDelta(addr, old, new)
+            for addr, (old, new) in enumerate(zip(self.current, dump))
+            if old != new
+        )
+        if deltas:
+            for delta in deltas:
+                self.current[delta.addr] = delta.new
+            self.deltas.append((timestamp, deltas))
+            self._timestamps.append(timestamp)
+        return deltas
+
+    # Registers content at timestamp (the last dump done at or before it), None if the first
+    # dump is more recent. Latest content if timestamp is None.
+    def at(self, timestamp=None):
+        if timestamp is None:
+            return bytes(self.current)
+        if timestamp < self.base_timestamp:
+            return None
+        dump = bytearray(self.base)
+        for _, deltas in self.deltas[: bisect_right(self._timestamps, timestamp)]:
+            for delta in deltas:
+                dump[delta.addr] = delta.new
+        return bytes(dump)
+
+
+# Register dumps of several modules (keys are up to the caller, e.g. slave ID or (port, ID))
+#   store = RegisterSnapshotStore()
+#   deltas = store.add(id, time.time(), full_dump(ser=ser, id=id))
+#   dump = store.at(id, timestamp)
+class RegisterSnapshotStore:
+    def __init__(self):
+        self.modules = {}
+
+    # Store a full dump of module. Returns None for the first dump of the module, else the tuple
+    # of RegisterDelta since the previous dump (empty if nothing changed).
+    def add(self, module, timestamp, dump):
+        history = self.modules.get(module)
+        if history is None:
+            self.modules[module] = ModuleRegisterHistory(timestamp, dump)
+            return None
+        return history.add(timestamp, dump)
+
+    def at(self, module, timestamp=None):
+        history = self.modules.get(module)
+        if history is None:
+            return None
+        return history.at(timestamp)
+
+    def clear(self, module=None):
+        if module is None:
+            self.modules.clear()
+        else:
+            self.modules.pop(module, None)
+
+
+# Text rendering of a full dump: "@<addr>:<hex value>" entries aligned on 2 hex digits
+def render_dump(dump):
+    return "".join(
+        f"@{addr}:{hex(byte)} " if byte > 15 else f"@{addr}:{hex(byte)}  "
+        for addr, byte in enumerate(dump)
+    )
+
+
+# Text rendering of register changes: "@<addr>:<old>-><new>" entries
+def render_deltas(deltas):
+    return " ".join(
+        f"@{delta.addr}:{hex(delta.old)}->{hex(delta.new)}" for delta in deltas
+    )
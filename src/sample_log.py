@@ -0,0 +1,129 @@
+import numpy as np
+import os
+import struct
+
+from serial_interface import (
+    ADC_NB_CHANNELS,
+    ADC_NB_MEAS,
+    ADC_RES_DTYPE,
+)
+
+# Binary sample log: a 16 bytes header then fixed size records, appended one after the other.
+# Header: magic, format version, record size (little-endian u32)
+SAMPLE_LOG_MAGIC = b"BQ76LOG\0"
+SAMPLE_LOG_VERSION = 1
+SAMPLE_LOG_HEADER = struct.Struct("<8sII")
+
+# Record flags: alerts, faults, cov and cuv bytes were read with the sample
+RECORD_STATUS_VALID = 0x01
+
+# 32 bytes record: time.time() timestamp, module ID, flags, alert/fault/COV/CUV status registers
+# and the raw ADC results registers (big-endian 16 bits words, as read at ADC_RES_ADDR)
+SAMPLE_RECORD = struct.Struct(f"<dBBBBBB{ADC_NB_MEAS}s")
+SAMPLE_RECORD_DTYPE = np.dtype(
+    [
+        ("timestamp", "<f8"),
+        ("id", "u1"),
+        ("flags", "u1"),
+        ("alerts", "u1"),
+        ("faults", "u1"),
+        ("cov", "u1"),
+        ("cuv", "u1"),
+        ("adc", ADC_RES_DTYPE, (ADC_NB_CHANNELS,)),
+    ]
+)
+
+
+class SampleLogError(Exception):
+    # Raised when a file is not a sample log of a supported format
+    pass
+
+
+def check_sample_log_header(header, path):
+    if len(header) < SAMPLE_LOG_HEADER.size:
+        raise SampleLogError(f"{path}: truncated sample log header.")
+    magic, version, record_size = SAMPLE_LOG_HEADER.unpack(header)
+    if magic != SAMPLE_LOG_MAGIC:
+        raise SampleLogError(f"{path}: not a sample log.")
+    if version != SAMPLE_LOG_VERSION or record_size != SAMPLE_RECORD.size:
+        raise SampleLogError(
+            f"{path}: unsupported sample log version {version} (record size {record_size})."
+        )
+
+
+# Append only writer. Records are buffered by the file object, flush() makes them visible to
+# the readers. An existing log is appended to, after dropping its partial last record if any
+# (writer interrupted), so the new records stay aligned.
+#   with SampleLogWriter(path) as log:
+#       log.append(timestamp, id, rx_data[3:-1], (alerts, faults, cov, cuv))
+class SampleLogWriter:
+    def __init__(self, path):
+        self.path = path
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, "rb") as log_file:
+                check_sample_log_header(log_file.read(SAMPLE_LOG_HEADER.size), path)
+            records_size = os.path.getsize(path) - SAMPLE_LOG_HEADER.size
+            whole_size = records_size - records_size % SAMPLE_RECORD.size
+            if whole_size != records_size:
+                os.truncate(path, SAMPLE_LOG_HEADER.size + whole_size)
+            self._file = open(path, "ab")
+        else:
+            self._file = open(path, "wb")
+            self._file.write(
+                SAMPLE_LOG_HEADER.pack(
+                    SAMPLE_LOG_MAGIC, SAMPLE_LOG_VERSION, SAMPLE_RECORD.size
+                )
+            )
+        self.nb_records = 0
+
+    # adc_results: ADC_NB_MEAS raw bytes read at ADC_RES_ADDR
+    # status: (alerts, faults, cov, cuv) registers values, or None if not read with the sample
+    def append(self, timestamp, id, adc_results, status=None):
+        flags = 0
+        if status is None:
+            status = (0, 0, 0, 0)
+        else:
+            flags |= RECORD_STATUS_VALID
+        self._file.write(
+            SAMPLE_RECORD.pack(timestamp, id, flags, *status, bytes(adc_results))
+        )
+        self.nb_records += 1
+
+    # records: SAMPLE_RECORD_DTYPE array, written as is
+    def append_records(self, records):
+        records = np.asarray(records, dtype=SAMPLE_RECORD_DTYPE)
+        self._file.write(records.tobytes())
+        self.nb_records += len(records)
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+# Records of a sample log as a read only SAMPLE_RECORD_DTYPE array mapped on the file (no
+# parsing nor copy). A partial record at the end of the file (e.g. writer interrupted) is
+# ignored.
+#   records = read_sample_log(path)
+#   module_5 = records[records["id"] == 5]
+#   gpai, vcells, temps = decode_adc_frames(module_5["adc"])
+def read_sample_log(path):
+    with open(path, "rb") as log_file:
+        check_sample_log_header(log_file.read(SAMPLE_LOG_HEADER.size), path)
+    nb_records = (os.path.getsize(path) - SAMPLE_LOG_HEADER.size) // SAMPLE_RECORD.size
+    if nb_records == 0:
+        return np.zeros(0, dtype=SAMPLE_RECORD_DTYPE)
+    return np.memmap(
+        path,
+        dtype=SAMPLE_RECORD_DTYPE,
+        mode="r",
+        offset=SAMPLE_LOG_HEADER.size,
+        shape=(nb_records,),
+    )
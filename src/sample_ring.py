@@ -0,0 +1,80 @@
+import numpy as np
+
+from serial_interface import (
+    ADC_NB_CHANNELS,
+    ADC_RES_DTYPE,
+)
+
+# Default number of samples kept per module
+SAMPLE_RING_SIZE = 4096
+
+
+# Fixed size history of the raw ADC samples of one module (timestamps and 16 bits codes).
+# Storage is preallocated and mirrored: each sample is written at index i and i + capacity of
+# 2 * capacity long columns, so the last n samples are always contiguous and windows are views,
+# never copies. Appending is O(1) and memory is fixed once created.
+#   ring = SampleRing()
+#   ring.append(timestamp, rx_data[3:-1])
+#   timestamps, codes = ring.window(100)
+#   gpai, vcells, temps = decode_adc_frames(codes)
+class SampleRing:
+    def __init__(self, capacity=SAMPLE_RING_SIZE):
+        self.capacity = capacity
+        self._timestamps = np.zeros(2 * capacity, dtype=np.float64)
+        self._codes = np.zeros((2 * capacity, ADC_NB_CHANNELS), dtype=np.uint16)
+        # Next write index (0 to capacity - 1) and number of samples stored
+        self._next = 0
+        self._size = 0
+        # Total number of samples appended since creation
+        self.nb_appended = 0
+
+    def __len__(self):
+        return self._size
+
+    # adc_results: ADC_NB_MEAS raw bytes read at ADC_RES_ADDR, or ADC_NB_CHANNELS codes
+    def append(self, timestamp, adc_results):
+        if not isinstance(adc_results, np.ndarray):
+            adc_results = np.frombuffer(bytes(adc_results), dtype=ADC_RES_DTYPE)
+        index = self._next
+        for offset in (index, index + self.capacity):
+            self._timestamps[offset] = timestamp
+            self._codes[offset] = adc_results
+        self._next = (index + 1) % self.capacity
+        self._size = min(self._size + 1, self.capacity)
+        self.nb_appended += 1
+
+    # timestamps[N] and codes[N, ADC_NB_CHANNELS] (raw codes, as decoded by decode_adc_frames)
+    def extend(self, timestamps, codes):
+        nb_samples = len(timestamps)
+        # Only the last capacity samples can be kept
+        keep = min(nb_samples, self.capacity)
+        indexes = (self._next + nb_samples - keep + np.arange(keep)) % self.capacity
+        for offset in (indexes, indexes + self.capacity):
+            self._timestamps[offset] = timestamps[nb_samples - keep :]
+            self._codes[offset] = codes[nb_samples - keep :]
+        self._next = (self._next + nb_samples) % self.capacity
+        self._size = min(self._size + nb_samples, self.capacity)
+        self.nb_appended += nb_samples
+
+    # Last n samples (all the stored ones if None), oldest first, as read only views:
+    # (timestamps[n], codes[n, ADC_NB_CHANNELS])
+    def window(self, n=None):
+        if n is None or n > self._size:
+            n = self._size
+        end = self._next + self.capacity
+        timestamps = self._timestamps[end - n : end]
+        codes = self._codes[end - n : end]
+        timestamps.flags.writeable = False
+        codes.flags.writeable = False
+        return timestamps, codes
+
+    # Last sample (timestamp, codes), None if empty
+    def latest(self):
+        if self._size == 0:
+            return None
+        timestamps, codes = self.window(1)
+        return timestamps[0], codes[0]
+
+    def clear(self):
+        self._next = 0
+        self._size = 0
@@ -1,16 +1,54 @@
-import crcmod
-import math
+import json
+import numpy as np
+import os
 import serial
+import time
 
-VERBOSE = True
+from collections import namedtuple
+from pathlib import Path
+
+# Trace levels: OFF (silent), INFO (helpers results), FRAMES (every transaction and TX/RX frame)
+TRACE_OFF = 0
+TRACE_INFO = 1
+TRACE_FRAMES = 2
+TRACE_LEVELS = {"off": TRACE_OFF, "info": TRACE_INFO, "frames": TRACE_FRAMES}
 
 SERIAL_BAUDRATE = 612500
+# Upper bound for a whole answer frame, the read returns as soon as the expected frame length is received
 SERIAL_TIMEOUT = 0.05
+# USB-UART adapters hold the received bytes up to their latency timer (16ms by default on the
+# FT232, which also sends long answers in 62 bytes chunks), so a silence shorter than that is
+# not the end of a frame
+ADAPTER_LATENCY = 0.016
+ADAPTER_LATENCY_MARGIN = 0.004
+# Max silence between two bytes of a frame, cuts short the echo of a missing slave. pyserial
+# only applies it on Windows (ReadIntervalTimeout), POSIX VTIME has a 100ms resolution.
+SERIAL_INTER_BYTE_TIMEOUT = ADAPTER_LATENCY + ADAPTER_LATENCY_MARGIN
+
+# Frame sizes: read answer = header (addr, reg, length) + data + CRC, write answer = echo of the 4 bytes sent
+READ_FRAME_HEADER_SIZE = 3
+READ_FRAME_OVERHEAD = READ_FRAME_HEADER_SIZE + 1
+WRITE_FRAME_SIZE = 4
+CRC8_POLY = 0x07
+
+# Slave discovery: a 1 byte read answer lasts ~80us at 612500 bauds, but a probe must wait at
+# least ADAPTER_LATENCY before giving up. Set it with set_probe_timeout when the adapter
+# latency timer is configured lower (or higher).
+# The last ID found on each port is saved in the slave ID cache (user state folder, see
+# slave_id_cache_path) and tried first on next discovery.
+PROBE_TIMEOUT = ADAPTER_LATENCY + ADAPTER_LATENCY_MARGIN
+SLAVE_ID_CACHE_FILE_NAME = "slave_id_cache.json"
+STATE_FOLDER_NAME = "TeslaMS1_BMS_SerialTool"
+
+# Read planner: up to READ_PLAN_MAX_GAP unrequested registers can be read between two
+# requested ones to merge them in a single ranged read (a byte costs ~16us, a transaction far more)
+READ_PLAN_MAX_GAP = 2
 
 # TI BQ76 related constants (registers addresses, number of measurements...)
 BROADCAST_ADDR = 0x3F
 RESET_REG_ADDR = 0x3C
 RESET_MAGIC_CODE = 0xA5
+ADDRESS_CONTROL_ADDR = 0x3B
 OV_REG_ADDR = 0x42
 UV_REG_ADDR = 0x44
 OT_REG_ADDR = 0x46
@@ -21,11 +59,44 @@ ADC_START_ADDR = 0x34
 ADC_CONFIG_ADDR = 0x30
 ADC_RES_ADDR = 0x01
 ADC_NB_MEAS = 9 * 2  # 9 * 2 bytes measurements
+ADC_CONFIG_FULL_MEAS = 0x3D  # GPAI, TS1, TS2 and cells 1 to 6 conversions
+IO_CONFIG_TS_MEAS = 0x03  # TS1 and TS2 pins configured for temperature measurement
+# ADC_CONFIG bits: TS2 (b5), TS1 (b4), GPAI (b3), CELL_SEL (b2:0, cells 1 to CELL_SEL + 1)
+ADC_CONFIG_CELL_SEL_MASK = 0x07
+ADC_CONFIG_CHANNEL_BITS = (0x08, 0x10, 0x20)
+# Conversion time of one ADC channel (datasheet, about 6us), plus a fixed margin
+ADC_CONV_TIME_PER_CHANNEL = 0.000006
+ADC_CONV_TIME_MARGIN = 0.0001
+# Completion polls of ADC_START once the conversion time is elapsed
+ADC_POLL_MAX = 3
+ADC_POLL_PERIOD = 0.0005
 ADDR_RANGE_FULL_SIZE = 0x4C
 ALERT_STATUS_ADDR = 0x20
 FAULT_STATUS_ADDR = 0x21
 OV_CELLS_ADDR = 0x22
 UV_CELLS_ADDR = 0x23
+CB_CTRL_ADDR = 0x32
+
+# Protected registers (EEPROM shadow), only writable after SHDW_UNLOCK_MAGIC_CODE
+PROTECTED_REGS_FIRST_ADDR = 0x40
+
+# Register volatility classes for the shadow register map:
+# VOLATILE registers are updated by the chip (status, ADC results, self-clearing commands...)
+# and must always be read from the slave, CACHED ones only change when written by the host.
+# Protected registers are always read too: they are the base of read-modify-write sequences
+# and are reloaded from the EEPROM at reset, a stale value would be written back to the chip.
+REG_VOLATILE = 0
+REG_CACHED = 1
+REG_VOLATILITY = bytes(
+    (
+        REG_VOLATILE
+        if addr < ADC_CONFIG_ADDR
+        or addr >= PROTECTED_REGS_FIRST_ADDR
+        or addr in (CB_CTRL_ADDR, ADC_START_ADDR, RESET_REG_ADDR)
+        else REG_CACHED
+    )
+    for addr in range(ADDR_RANGE_FULL_SIZE)
+)
 
 # Conversion table for Over Temperature Threshold Value TO Degrees Celcius
 OT_THR_TO_CELCIUS_LU_TABLE = {
@@ -59,214 +130,890 @@ OT_THR_TO_CELCIUS_LU_TABLE_REVERSE = {
 }
 
 
-def _print(*args, **kwargs):
-    if VERBOSE:
-        print(*args, **kwargs)
+_trace_level = TRACE_INFO
+# Any file-like object, None means sys.stdout
+_trace_sink = None
+_probe_timeout = PROBE_TIMEOUT
+
+
+def set_trace_level(level):
+    global _trace_level
+    _trace_level = TRACE_LEVELS[level] if isinstance(level, str) else level
+
+
+def get_trace_level():
+    return _trace_level
+
+
+def set_trace_sink(sink):
+    global _trace_sink
+    _trace_sink = sink
+
+
+def set_probe_timeout(timeout):
+    global _probe_timeout
+    _probe_timeout = timeout
+
+
+def get_probe_timeout():
+    return _probe_timeout
+
+
+# Hot path callers must check _trace_level before building their message
+def _print(*args, level=TRACE_INFO, **kwargs):
+    if _trace_level >= level:
+        print(*args, file=_trace_sink, **kwargs)
 
 
 class CrcNok(Exception):
     # Raised when there is a CRC check missmatch
     def __init__(self, message):
+        super().__init__(message)
+        _print(message)
+
+
+class NoSlaveFound(Exception):
+    # Raised when no slave answers the ID discovery
+    def __init__(self, message):
+        super().__init__(message)
+        _print(message)
+
+
+class AdcTimeout(Exception):
+    # Raised when the ADC conversion is still ongoing after the completion polls
+    def __init__(self, message):
+        super().__init__(message)
         _print(message)
 
 
 # Connect to serial port identified by port_name
 def con_serial_port(port_name):
+    # Whatever was cached for this port may be another board (or a power cycled one) now
+    forget_port_shadows(port_name)
     serial_con = None
     try:
         serial_con = serial.Serial(
-            port=port_name, baudrate=SERIAL_BAUDRATE, timeout=SERIAL_TIMEOUT
+            port=port_name,
+            baudrate=SERIAL_BAUDRATE,
+            timeout=SERIAL_TIMEOUT,
+            inter_byte_timeout=SERIAL_INTER_BYTE_TIMEOUT,
         )
-        _print(f"Connection has been set to {port_name}.")
+        if _trace_level >= TRACE_INFO:
+            _print(f"Connection has been set to {port_name}.")
     except IOError:
         try:
             serial_con.close()
             serial_con.open()
-            _print(
-                f"{port_name} was already open, it has been closed and opened again."
-            )
+            if _trace_level >= TRACE_INFO:
+                _print(
+                    f"{port_name} was already open, it has been closed and opened again."
+                )
         except:
-            _print(
-                f"ERROR: can't open {port_name}. Check its config (serial_interface.con_serial_port)."
-            )
+            if _trace_level >= TRACE_INFO:
+                _print(
+                    f"ERROR: can't open {port_name}. Check its config (serial_interface.con_serial_port)."
+                )
     return serial_con
 
 
 # Disconnect from serial port identified by port_name
 def disco_serial_port(serial_con):
     try:
+        forget_port_shadows(serial_con.port)
         serial_con.close()
-        _print(f"Disconnected from {serial_con.port}.")
+        if _trace_level >= TRACE_INFO:
+            _print(f"Disconnected from {serial_con.port}.")
         return True
     except:
-        _print(
-            f"ERROR: can't open {serial_con.port}. Check its config (serial_interface.con_serial_port)."
-        )
+        if _trace_level >= TRACE_INFO:
+            _print(
+                f"ERROR: can't open {serial_con.port}. Check its config (serial_interface.con_serial_port)."
+            )
         return False
 
 
+def _make_crc8_table(poly):
+    table = bytearray(256)
+    for i in range(256):
+        crc = i
+        for _ in range(8):
+            crc = ((crc << 1) ^ poly) if crc & 0x80 else (crc << 1)
+            crc &= 0xFF
+        table[i] = crc
+    return bytes(table)
+
+
+# CRC-8 used by the BQ76 (poly x^8+x^2+x+1, init 0, not reflected), table built once at import
+CRC8_TABLE = _make_crc8_table(CRC8_POLY)
+
+
+# Incremental CRC update, data can be bytes, bytearray, memoryview (no copy) or a list of ints
+def crc8_update(crc, data):
+    table = CRC8_TABLE
+    for byte in data:
+        crc = table[crc ^ byte]
+    return crc
+
+
 def crc8_func(byte_array):
-    return crcmod.mkCrcFun(0x107, initCrc=0, rev=False)(byte_array)
+    return crc8_update(0, byte_array)
+
+
+# CRC of an answer frame (CRC byte excluded), bit 7 of the address byte is set by the slave
+def read_frame_crc(frame):
+    return crc8_update(CRC8_TABLE[frame[0] & 0x7F], memoryview(frame)[1:-1])
+
+
+def read_frame_crc_ok(frame):
+    return len(frame) > 1 and frame[-1] == read_frame_crc(frame)
+
+
+# Check a list of captured answer frames, returns one boolean per frame
+def crc8_verify_frames(frames):
+    return [read_frame_crc_ok(frame) for frame in frames]
 
 
 def print_packet(tx_rx, bytes):
-    _print(f"{tx_rx.upper()}: ", end="")
-    for byte in bytes:
-        _print(hex(byte), end=" ")
-    _print("")
+    _print(f"{tx_rx.upper()}: {bytes.hex(' ')}", level=TRACE_FRAMES)
+
+
+# Last known content of the registers of one slave (filled by full_dump and every checked
+# read, updated by every write whose echo is verified)
+class RegisterShadow:
+    def __init__(self):
+        self.values = bytearray(ADDR_RANGE_FULL_SIZE)
+        self.valid = bytearray(ADDR_RANGE_FULL_SIZE)
+
+    # Cached value of reg_addr, None if it must be read from the slave
+    def get(self, reg_addr):
+        if self.valid[reg_addr] and REG_VOLATILITY[reg_addr] == REG_CACHED:
+            return self.values[reg_addr]
+        return None
+
+    def update(self, reg_addr, data):
+        end = min(reg_addr + len(data), ADDR_RANGE_FULL_SIZE)
+        self.values[reg_addr:end] = data[: end - reg_addr]
+        self.valid[reg_addr:end] = b"\x01" * (end - reg_addr)
+
+    def invalidate(self):
+        self.valid = bytearray(ADDR_RANGE_FULL_SIZE)
+
+
+# Shadow register maps, by serial port name and slave ID
+_shadows = {}
+
+
+def get_shadow(ser, id):
+    key = (ser.port, id)
+    shadow = _shadows.get(key)
+    if shadow is None:
+        shadow = _shadows[key] = RegisterShadow()
+    return shadow
+
+
+# Drop the shadow maps of every slave on port (connection, disconnection, discovery)
+def forget_port_shadows(port):
+    for key in [key for key in _shadows if key[0] == port]:
+        del _shadows[key]
+
+
+def _port_shadows(ser, id):
+    if id == BROADCAST_ADDR:
+        return [shadow for key, shadow in _shadows.items() if key[0] == ser.port]
+    return [get_shadow(ser, id)]
+
+
+def shadow_read_done(ser, id, reg_addr, ans):
+    if id != BROADCAST_ADDR:
+        get_shadow(ser, id).update(reg_addr, ans[READ_FRAME_HEADER_SIZE:-1])
+
+
+def shadow_write_done(ser, id, reg_addr, val, packet, ans):
+    if ans != packet:
+        # Write not confirmed, the register content is unknown
+        for shadow in _port_shadows(ser, id):
+            shadow.valid[reg_addr] = 0
+        return
+    if reg_addr == RESET_REG_ADDR or reg_addr == ADDRESS_CONTROL_ADDR:
+        # Every register can change, the slave(s) must be dumped again
+        for shadow in _port_shadows(ser, id):
+            shadow.invalidate()
+        if reg_addr == ADDRESS_CONTROL_ADDR:
+            get_shadow(ser, val & 0x3F).invalidate()
+        return
+    for shadow in _port_shadows(ser, id):
+        shadow.update(reg_addr, (val,))
+
+
+# Register value from the shadow if it is cacheable and known, read from the slave otherwise
+def read_reg(ser, id, reg_addr):
+    val = get_shadow(ser, id).get(reg_addr)
+    if val is None:
+        val = read_bq76(ser, id, reg_addr, 0x1)[3]
+    return val
+
+
+def read_frame_size(length):
+    return READ_FRAME_OVERHEAD + length
+
+
+def read_packet(id, reg_addr, length):
+    return bytes((id << 1, reg_addr, length))
+
+
+def write_packet(id, reg_addr, val):
+    packet = bytearray(((id << 1) | 0x1, reg_addr, val))
+    packet.append(crc8_func(packet))
+    return packet
+
+
+# Send a packet and wait for an answer of expected_size bytes.
+# The read returns as soon as expected_size bytes are received, or at SERIAL_TIMEOUT (earlier on
+# Windows if the line stays silent for SERIAL_INTER_BYTE_TIMEOUT, e.g: a non addressed slave only
+# echoes the 3 bytes request).
+# Late bytes of a previous answer are dropped first, so they can't prefix this answer.
+def transfer(ser, packet, expected_size):
+    ser.reset_input_buffer()
+    ser.write(packet)
+    ans = ser.read(expected_size)
+    if _trace_level >= TRACE_FRAMES:
+        print_packet("tx", packet)
+        print_packet("rx", ans)
+    return ans
 
 
 def read_bq76(ser, id, reg_addr, length):
-    _print(f"-> Reading {length} bytes at @{hex(reg_addr)} from BQ76 #{id}")
-    packet = [id << 1, reg_addr, length]
+    if _trace_level >= TRACE_FRAMES:
+        _print(f"-> Reading {length} bytes at @{hex(reg_addr)} from BQ76 #{id}")
+    packet = read_packet(id, reg_addr, length)
     # crc = crc8_func(bytearray(packet))
     # packet.append(crc)
 
-    print_packet("tx", packet)
-    ser.write(bytearray(packet))
-    ans = ser.read(255)
-    print_packet("rx", ans)
+    ans = transfer(ser, packet, read_frame_size(length))
 
-    crc_data = [ans[0] & 0x7F] + [b for b in ans[1:-1]]
-    crc_res = crc8_func(bytearray(crc_data))
-    if ans[-1] == crc_res:
-        _print(f"CRC OK: expected:{hex(crc_res)}==received:{hex(ans[-1])}")
-    else:
-        raise CrcNok(f"CRC NOK: expected:{hex(crc_res)}!=received:{hex(ans[-1])}")
-    _print("")
+    check_read_answer(ans, id, length)
+    shadow_read_done(ser, id, reg_addr, ans)
+    return ans
 
+
+# Raise CrcNok if the answer to a read of length bytes is missing, truncated or corrupted
+# (a non addressed slave only echoes the 3 bytes request, whose last byte can match the CRC)
+def check_read_answer(ans, id, length):
+    if not ans:
+        raise CrcNok(f"CRC NOK: no answer from BQ76 #{id}")
+    if len(ans) != read_frame_size(length):
+        raise CrcNok(
+            f"CRC NOK: {len(ans)} bytes received from BQ76 #{id}, expected {read_frame_size(length)}"
+        )
+    crc_res = read_frame_crc(ans)
+    if ans[-1] != crc_res:
+        raise CrcNok(f"CRC NOK: expected:{hex(crc_res)}!=received:{hex(ans[-1])}")
+    if _trace_level >= TRACE_FRAMES:
+        _print(f"CRC OK: expected:{hex(crc_res)}==received:{hex(ans[-1])}\n")
     return ans
 
 
 def write_bq76(ser, id, reg_addr, val):
-    _print(f"-> Writing {hex(val)} at @{hex(reg_addr)} of BQ76 #{id}")
-    packet = [(id << 1) | 0x1, reg_addr, val]
-    crc = crc8_func(bytearray(packet))
-    packet.append(crc)
+    if _trace_level >= TRACE_FRAMES:
+        _print(f"-> Writing {hex(val)} at @{hex(reg_addr)} of BQ76 #{id}")
+    packet = write_packet(id, reg_addr, val)
 
-    print_packet("tx", packet)
-    ser.write(bytearray(packet))
-    ans = ser.read(255)
-    print_packet("rx", ans)
-    _print("")
+    ans = transfer(ser, packet, WRITE_FRAME_SIZE)
+    shadow_write_done(ser, id, reg_addr, val, packet, ans)
+    if _trace_level >= TRACE_FRAMES:
+        _print("")
 
     return ans
 
 
+# Procedures shared with serial_interface_async are written once, as steps generators: they
+# yield the serial operations to do and receive their results, run_steps (or the async
+# run_steps of serial_interface_async) executes them. Only the I/O differs between both paths.
+#   def start_adc_meas(*, ser, id, adc_config=None):
+#       return run_steps(ser, start_adc_meas_steps(id, adc_config))
+STEP_READ = "read"  # (STEP_READ, id, reg_addr, length) -> read_bq76 answer
+STEP_WRITE = "write"  # (STEP_WRITE, id, reg_addr, val) -> write_bq76 answer
+STEP_READ_REG = "read_reg"  # (STEP_READ_REG, id, reg_addr) -> read_reg value
+STEP_READ_RANGES = "read_ranges"  # (STEP_READ_RANGES, id, ranges) -> BatchResult list
+STEP_PROBE = "probe"  # (STEP_PROBE, id) -> probe_slave answer, None on a miss
+STEP_SLEEP = "sleep"  # (STEP_SLEEP, seconds) -> None
+
+
+def run_steps(ser, steps):
+    result = None
+    try:
+        while True:
+            result = run_step(ser, steps.send(result))
+    except StopIteration as stop:
+        return stop.value
+
+
+def run_step(ser, step):
+    kind, *args = step
+    if kind == STEP_READ:
+        return read_bq76(ser, *args)
+    if kind == STEP_WRITE:
+        return write_bq76(ser, *args)
+    if kind == STEP_READ_REG:
+        return read_reg(ser, *args)
+    if kind == STEP_READ_RANGES:
+        return read_ranges_batch(ser, *args).run()
+    if kind == STEP_PROBE:
+        return probe_slave(ser, *args)
+    if kind == STEP_SLEEP:
+        time.sleep(*args)
+        return None
+    raise ValueError(f"Unknown step {kind}")
+
+
+# One result per queued transaction: frame is the raw answer (same as read_bq76/write_bq76 return),
+# data the read bytes (or the echoed value for a write) and crc_ok the frame check status
+# (CRC for a read, exact echo for a write).
+BatchResult = namedtuple(
+    "BatchResult", ["is_write", "id", "reg_addr", "frame", "data", "crc_ok"]
+)
+
+
+# Pipelined transactions: the queued packets are sent back to back in one ser.write and
+# the answers stream is split using the known answer length of each transaction.
+# If a slave does not answer (short echo), the following frames get misaligned and are
+# reported with crc_ok=False, the caller decides whether to retry them one by one.
+class Bq76Batch:
+    def __init__(self, ser):
+        self.ser = ser
+        self._packets = bytearray()
+        self._items = []
+
+    def __len__(self):
+        return len(self._items)
+
+    def read(self, id, reg_addr, length):
+        self._packets += read_packet(id, reg_addr, length)
+        self._items.append((False, id, reg_addr, read_frame_size(length), None))
+        return len(self._items) - 1
+
+    def write(self, id, reg_addr, val):
+        packet = write_packet(id, reg_addr, val)
+        self._packets += packet
+        self._items.append((True, id, reg_addr, WRITE_FRAME_SIZE, bytes(packet)))
+        return len(self._items) - 1
+
+    def clear(self):
+        self._packets = bytearray()
+        self._items = []
+
+    # Queued packets, to send in one exchange, and the length of the whole answer
+    @property
+    def packets(self):
+        return bytes(self._packets)
+
+    @property
+    def expected_size(self):
+        return sum(item[3] for item in self._items)
+
+    def run(self):
+        return self.process(transfer(self.ser, self._packets, self.expected_size))
+
+    # Split the answer of the exchange into one BatchResult per queued transaction
+    def process(self, ans):
+        results = []
+        offset = 0
+        for is_write, id, reg_addr, size, packet in self._items:
+            frame = ans[offset : offset + size]
+            offset += size
+            if is_write:
+                data = frame[2:3]
+                crc_ok = frame == packet
+                shadow_write_done(self.ser, id, reg_addr, packet[2], packet, frame)
+            else:
+                data = frame[READ_FRAME_HEADER_SIZE:-1]
+                crc_ok = len(frame) == size and read_frame_crc_ok(frame)
+                if crc_ok:
+                    shadow_read_done(self.ser, id, reg_addr, frame)
+            results.append(BatchResult(is_write, id, reg_addr, frame, data, crc_ok))
+        self.clear()
+        return results
+
+
+# Merge register addresses into as few (start, length) ranged reads as possible,
+# reading at most max_gap unrequested registers between two requested ones
+def plan_reads(reg_addrs, max_gap=READ_PLAN_MAX_GAP):
+    ranges = []
+    for reg_addr in sorted(set(reg_addrs)):
+        if ranges and reg_addr - (ranges[-1][0] + ranges[-1][1]) <= max_gap:
+            start = ranges[-1][0]
+            ranges[-1] = (start, reg_addr - start + 1)
+        else:
+            ranges.append((reg_addr, 1))
+    return ranges
+
+
+# Read the requested registers with the planned ranged reads, pipelined in one exchange.
+# Returns {reg_addr: value} in the order of reg_addrs.
+def read_registers(*, ser, id, reg_addrs, max_gap=READ_PLAN_MAX_GAP):
+    return run_steps(ser, read_registers_steps(id, reg_addrs, max_gap))
+
+
+# Batch of the ranged reads of one slave
+def read_ranges_batch(ser, id, ranges):
+    batch = Bq76Batch(ser)
+    for start, length in ranges:
+        batch.read(id, start, length)
+    return batch
+
+
+def read_registers_steps(id, reg_addrs, max_gap=READ_PLAN_MAX_GAP):
+    results = yield (STEP_READ_RANGES, id, plan_reads(reg_addrs, max_gap))
+    regs = {}
+    for res in results:
+        if not res.crc_ok:
+            raise CrcNok(
+                f"CRC NOK: {len(res.data)} registers @{hex(res.reg_addr)} of slave {id}"
+            )
+        for offset, val in enumerate(res.data):
+            regs[res.reg_addr + offset] = val
+    return {reg_addr: regs[reg_addr] for reg_addr in reg_addrs}
+
+
 def full_dump(*, ser, id):
     rx_data = read_bq76(ser, id, 0x00, ADDR_RANGE_FULL_SIZE)
-    _print(f"Full dump done for slave {id}.\n")
-    return rx_data[3:]
+    if _trace_level >= TRACE_INFO:
+        _print(f"Full dump done for slave {id}.\n")
+    return rx_data[READ_FRAME_HEADER_SIZE:-1]
 
 
 def reset_slave(*, ser, id):
     rx_data = write_bq76(ser, id, RESET_REG_ADDR, RESET_MAGIC_CODE)
-    _print(f"Reset slave {id}.\n")
+    if _trace_level >= TRACE_INFO:
+        _print(f"Reset slave {id}.\n")
     return rx_data
 
 
-def get_slave_id(*, ser):
+# Per user state folder: %LOCALAPPDATA% on Windows, $XDG_STATE_HOME (~/.local/state) otherwise
+def user_state_folder():
+    if os.name == "nt" and os.environ.get("LOCALAPPDATA"):
+        base = Path(os.environ["LOCALAPPDATA"])
+    else:
+        base = Path(
+            os.environ.get("XDG_STATE_HOME") or Path.home() / ".local" / "state"
+        )
+    return base / STATE_FOLDER_NAME
+
+
+def slave_id_cache_path():
+    return user_state_folder() / SLAVE_ID_CACHE_FILE_NAME
+
+
+def load_slave_id_cache():
+    try:
+        with open(slave_id_cache_path()) as cache_file:
+            return json.load(cache_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_slave_id(port, id):
+    cache = load_slave_id_cache()
+    if cache.get(str(port)) == id:
+        return
+    cache[str(port)] = id
+    path = slave_id_cache_path()
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w") as cache_file:
+            json.dump(cache, cache_file)
+    except OSError:
+        if _trace_level >= TRACE_INFO:
+            _print(f"WARNING: can't save slave ID cache to {path}.")
+
+
+# Read the address control register of tested_id, returns None if nobody answers
+# (a miss is expected while probing, so no CrcNok is raised)
+def probe_slave(ser, tested_id):
+    rx_data = transfer(
+        ser, read_packet(tested_id, ADDRESS_CONTROL_ADDR, 0x1), read_frame_size(0x1)
+    )
+    if probe_answer_ok(rx_data, tested_id):
+        return rx_data
+    return None
+
+
+# Answer to a probe of tested_id: a valid address control register read frame coming from
+# tested_id (any slave for the broadcast address), so a late answer to a previous probe is
+# never taken for this one
+def probe_answer_ok(rx_data, tested_id):
+    if len(rx_data) != read_frame_size(0x1) or not read_frame_crc_ok(rx_data):
+        return False
+    if rx_data[1] != ADDRESS_CONTROL_ADDR or rx_data[2] != 0x1:
+        return False
+    return tested_id == BROADCAST_ADDR or (rx_data[0] & 0x7F) >> 1 == tested_id
+
+
+# Discovery order: last ID found on this port, broadcast read (only answered in a usable
+# way when a single slave is on the bus, so its answer is confirmed by a direct read),
+# then all the remaining IDs. Every probe uses the probe timeout (see set_probe_timeout).
+def get_slave_id(*, ser, use_broadcast=True):
+    timeout_backup = ser.timeout
+    ser.timeout = _probe_timeout
+    try:
+        return run_steps(
+            ser, get_slave_id_steps(getattr(ser, "port", None), use_broadcast)
+        )
+    finally:
+        ser.timeout = timeout_backup
+
+
+def get_slave_id_steps(port, use_broadcast):
     _print("Searching for board ID...")
-    for tested_id in range(0x00, 0x3F):
-        _print(f"Testing ID {tested_id}")
-        try:
-            rx_data = read_bq76(ser, tested_id, 0x3B, 0x1)
-        except CrcNok:
-            continue
-        if len(rx_data) < 4:
+    forget_port_shadows(port)
+    cached_id = load_slave_id_cache().get(str(port))
+    rx_data = yield from find_slave_steps(cached_id, use_broadcast)
+    if rx_data is None:
+        raise NoSlaveFound(f"No BMS slave answered on {port}.")
+
+    slave_id = decode_slave_id(rx_data)
+    save_slave_id(port, slave_id)
+    return slave_id
+
+
+def find_slave_steps(cached_id, use_broadcast):
+    if cached_id is not None:
+        rx_data = yield (STEP_PROBE, cached_id)
+        if rx_data is not None:
+            return rx_data
+    if use_broadcast:
+        rx_data = yield (STEP_PROBE, BROADCAST_ADDR)
+        if rx_data is not None:
+            rx_data = yield (STEP_PROBE, rx_data[3] & 0x3F)
+            if rx_data is not None:
+                return rx_data
+    for tested_id in range(0x00, BROADCAST_ADDR):
+        if tested_id == cached_id:
             continue
-        slave_id = rx_data[3] & 0x3F
-        break
+        if _trace_level >= TRACE_FRAMES:
+            _print(f"Testing ID {tested_id}")
+        rx_data = yield (STEP_PROBE, tested_id)
+        if rx_data is not None:
+            return rx_data
+    return None
+
 
+# Decode the answer to a read of the address control register
+def decode_slave_id(rx_data):
+    slave_id = rx_data[3] & 0x3F
     if rx_data[3] & 0x80:
-        _print(f"Slave ID: {slave_id} (set)\n")
+        if _trace_level >= TRACE_INFO:
+            _print(f"Slave ID: {slave_id} (set)\n")
     else:
-        _print(f"Slave ID: {slave_id} (unset)\n")
+        if _trace_level >= TRACE_INFO:
+            _print(f"Slave ID: {slave_id} (unset)\n")
     return slave_id
 
 
 def set_slave_id(*, ser, old_id, new_id):
-    rx_data = write_bq76(ser, old_id, 0x3B, 0x80 | new_id)
+    rx_data = write_bq76(ser, old_id, ADDRESS_CONTROL_ADDR, 0x80 | new_id)
+    if check_slave_id_echo(rx_data, old_id, new_id) == -1:
+        return -1
+    save_slave_id(getattr(ser, "port", None), new_id)
+    return 0
+
+
+def check_slave_id_echo(rx_data, old_id, new_id):
     if len(rx_data) < 3:
-        _print(f"ERROR: set_slave_id {old_id}->{new_id} failed.\n")
+        if _trace_level >= TRACE_INFO:
+            _print(f"ERROR: set_slave_id {old_id}->{new_id} failed.\n")
         return -1
     if rx_data[2] == (0x80 | new_id):
-        _print(f"ID update OK: {old_id}->{new_id}.\n")
+        if _trace_level >= TRACE_INFO:
+            _print(f"ID update OK: {old_id}->{new_id}.\n")
         return 0
     else:
-        _print(f"ID update NOK: {old_id}-/->{new_id}.\n")
+        if _trace_level >= TRACE_INFO:
+            _print(f"ID update NOK: {old_id}-/->{new_id}.\n")
         return -1
 
 
-def start_adc_meas(*, ser, id):
-    rx_data = write_bq76(ser, id, ADC_START_ADDR, 0x1)
-    rx_data = read_bq76(ser, id, ADC_START_ADDR, 0x1)
-    meas_ongoing = rx_data[3]
-    # Wait for end of measurement
-    while meas_ongoing == 0x1:
-        rx_data = read_bq76(ser, id, ADC_START_ADDR, 0x1)
-        meas_ongoing = rx_data[3]
-    _print(f"ADC meas started for slave {id}.\n")
+# Number of channels converted with ADC_CONFIG register value adc_config
+def adc_nb_channels(adc_config):
+    nb_channels = min(adc_config & ADC_CONFIG_CELL_SEL_MASK, 5) + 1
+    for bit in ADC_CONFIG_CHANNEL_BITS:
+        if adc_config & bit:
+            nb_channels += 1
+    return nb_channels
 
 
-def read_adc_meas(*, ser, id):
-    # Store actual registers content to set it back after readings
-    rx_data = read_bq76(ser, id, ADC_CONFIG_ADDR, 0x1)
-    adc_config_reg_backup = rx_data[3]
-    rx_data = read_bq76(ser, id, IO_CONFIG_ADDR, 0x1)
-    io_config_reg_backup = rx_data[3]
+def adc_conv_time(adc_config):
+    return (
+        ADC_CONV_TIME_MARGIN + adc_nb_channels(adc_config) * ADC_CONV_TIME_PER_CHANNEL
+    )
+
+
+def check_adc_done(id, rx_data, polls, latency):
+    if rx_data[3] & 0x1:
+        raise AdcTimeout(
+            f"ERROR: ADC meas of slave {id} still ongoing after {polls} polls ({latency * 1000:.3f}ms)"
+        )
+
+
+# Start a conversion and wait for its end: the conversion time of the enabled channels is waited
+# first, then ADC_START is polled at most ADC_POLL_MAX times.
+# adc_config is the ADC_CONFIG value used for the conversion (read from the shadow map if None).
+# Returns the conversion latency in seconds, from ADC_START write to the completion read.
+def start_adc_meas(*, ser, id, adc_config=None):
+    return run_steps(ser, start_adc_meas_steps(id, adc_config))
+
+
+def start_adc_meas_steps(id, adc_config=None):
+    if adc_config is None:
+        adc_config = yield (STEP_READ_REG, id, ADC_CONFIG_ADDR)
+    start = time.perf_counter()
+    yield (STEP_WRITE, id, ADC_START_ADDR, 0x1)
+    remaining = start + adc_conv_time(adc_config) - time.perf_counter()
+    if remaining > 0:
+        yield (STEP_SLEEP, remaining)
+
+    for poll in range(1, ADC_POLL_MAX + 1):
+        rx_data = yield (STEP_READ, id, ADC_START_ADDR, 0x1)
+        if not rx_data[3] & 0x1 or poll == ADC_POLL_MAX:
+            break
+        yield (STEP_SLEEP, ADC_POLL_PERIOD)
+    latency = time.perf_counter() - start
+    check_adc_done(id, rx_data, poll, latency)
+
+    if _trace_level >= TRACE_INFO:
+        _print(f"ADC meas done for slave {id} in {latency * 1000:.3f}ms.\n")
+    return latency
+
+
+# Acquisition session: ADC_CONFIG and IO_CONFIG are configured for the full measurement once
+# when the session opens and set back once when it closes. Each sample then only costs the
+# conversion trigger, its completion check and the results read.
+#   with AdcSession(ser, id) as session:
+#       meas = session.sample()
+# AdcSessionSteps holds the session state and steps, shared with serial_interface_async.
+class AdcSessionSteps:
+    def __init__(self, ser, id):
+        self.ser = ser
+        self.id = id
+        self.adc_config_reg_backup = None
+        self.io_config_reg_backup = None
+        # Conversion latency of the last sample (seconds)
+        self.conv_latency = None
+
+    def open_steps(self):
+        id = self.id
+        # Store actual registers content to set it back when closing
+        self.adc_config_reg_backup = yield (STEP_READ_REG, id, ADC_CONFIG_ADDR)
+        self.io_config_reg_backup = yield (STEP_READ_REG, id, IO_CONFIG_ADDR)
+
+        # Configure ADC for full measurement
+        yield (
+            STEP_WRITE,
+            id,
+            ADC_CONFIG_ADDR,
+            self.adc_config_reg_backup | ADC_CONFIG_FULL_MEAS,
+        )
+        # Configure TS1 and TS2 pins for temperature measurement
+        yield (
+            STEP_WRITE,
+            id,
+            IO_CONFIG_ADDR,
+            self.io_config_reg_backup | IO_CONFIG_TS_MEAS,
+        )
+        if _trace_level >= TRACE_INFO:
+            _print(
+                f"Full ADC meas (GPAI, TS1, TS2, C1-2-3-4-5-6) configured for slave {id}.\n"
+            )
+        return self
+
+    def close_steps(self):
+        if self.adc_config_reg_backup is None:
+            return
+        # Setting back registers' content
+        yield (STEP_WRITE, self.id, ADC_CONFIG_ADDR, self.adc_config_reg_backup)
+        yield (STEP_WRITE, self.id, IO_CONFIG_ADDR, self.io_config_reg_backup)
+        self.adc_config_reg_backup = None
+        self.io_config_reg_backup = None
+
+    def sample_raw_steps(self):
+        self.conv_latency = yield from start_adc_meas_steps(
+            self.id, self.adc_config_reg_backup | ADC_CONFIG_FULL_MEAS
+        )
+        return (yield (STEP_READ, self.id, ADC_RES_ADDR, ADC_NB_MEAS))
+
+
+class AdcSession(AdcSessionSteps):
+    def open(self):
+        return run_steps(self.ser, self.open_steps())
+
+    def close(self):
+        run_steps(self.ser, self.close_steps())
 
-    # Configure ADC for full measurement
-    write_bq76(ser, id, ADC_CONFIG_ADDR, adc_config_reg_backup | 0x3D)
-    # Configure TS1 and TS2 pins for temperature measurement
-    write_bq76(ser, id, IO_CONFIG_ADDR, io_config_reg_backup | 0x03)
-    _print(f"Full ADC meas (GPAI, TS1, TS2, C1-2-3-4-5-6) configured for slave {id}.\n")
+    def __enter__(self):
+        return self.open()
 
-    start_adc_meas(ser=ser, id=id)
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
+    # Raw answer to the results read (ADC_NB_MEAS bytes at ADC_RES_ADDR)
+    def sample_raw(self):
+        return run_steps(self.ser, self.sample_raw_steps())
+
+    # GPAI, Vcell1-6, Temp1, Temp2 (see read_adc_meas)
+    def sample(self):
+        return decode_adc_meas(self.sample_raw())
+
+
+def read_adc_meas(*, ser, id):
+    return decode_adc_meas(read_adc_raw(ser=ser, id=id))
+
+
+# Raw answer to the ADC results read of a single sample (see AdcSession.sample_raw)
+def read_adc_raw(*, ser, id):
+    with AdcSession(ser, id) as session:
+        return session.sample_raw()
+
+
+# Sample yielded by stream_adc:
+# - seq: sample number, starting at 0
+# - monotonic: time.monotonic() at the sample deadline the conversion was started for
+# - timestamp: time.time() when the conversion was started
+# - meas: decoded measurements (see decode_adc_meas)
+# - conv_latency: ADC conversion latency in seconds (see start_adc_meas)
+# - missed: number of deadlines skipped since the previous sample
+AdcSample = namedtuple(
+    "AdcSample", ["seq", "monotonic", "timestamp", "meas", "conv_latency", "missed"]
+)
+
+
+# Continuous acquisition at rate_hz samples per second, within a single AdcSession.
+# Deadlines are absolute (start + n * period on the monotonic clock) so time spent in the
+# serial exchanges or in the consumer does not drift the rate. When a deadline is already
+# over by more than a period, the late deadlines are skipped and counted in missed.
+# Stops after count samples (never if None), the registers are set back when the generator
+# is closed:
+#   for sample in stream_adc(ser=ser, id=id, rate_hz=10):
+#       ...
+def stream_adc(*, ser, id, rate_hz, count=None):
+    with AdcSession(ser, id) as session:
+        for seq, (deadline, missed) in enumerate(paced(rate_hz, count)):
+            if missed and _trace_level >= TRACE_INFO:
+                _print(f"ADC stream of slave {id}: {missed} deadline(s) missed.")
+            timestamp = time.time()
+            meas = session.sample()
+            yield AdcSample(
+                seq, deadline, timestamp, meas, session.conv_latency, missed
+            )
+
+
+# Next sample deadline after deadline, skipping the ones already over by more than a period.
+# Returns (deadline, number of skipped deadlines)
+def next_deadline(deadline, period, now):
+    deadline += period
+    missed = 0
+    if now - deadline >= period:
+        missed = int((now - deadline) // period)
+        deadline += missed * period
+    return deadline, missed
+
+
+# Periodic acquisitions pacing: waits for each deadline and yields (deadline, missed), see
+# stream_adc. Without rate_hz (None) there is no wait, the deadline is the current time.
+# Stops after count deadlines (never if None).
+def paced(rate_hz, count=None):
+    period = None if rate_hz is None else 1 / rate_hz
+    deadline = time.monotonic()
+    missed = 0
+    nb_deadlines = 0
+    while count is None or nb_deadlines < count:
+        if period is None:
+            deadline = time.monotonic()
+        else:
+            remaining = deadline - time.monotonic()
+            if remaining > 0:
+                time.sleep(remaining)
+        yield deadline, missed
+        nb_deadlines += 1
+        if period is not None:
+            deadline, missed = next_deadline(deadline, period, time.monotonic())
+
+
+# Decode the answer to a read of the ADC_NB_MEAS bytes at ADC_RES_ADDR
+# ADC results registers (GPAI, VCELL1-6, TEMP1, TEMP2) are big-endian 16 bits values
+ADC_RES_DTYPE = np.dtype(">u2")
+ADC_NB_CHANNELS = ADC_NB_MEAS // ADC_RES_DTYPE.itemsize
+
+
+# Temperature (degC) from TS1/TS2 ADC codes, NaN where the thermistor resistance is not positive.
+# Temperatures are operated using the steinhart/hart equation
+# See the readModuleValues function at https://github.com/collin80/TeslaBMS/blob/master/BMSModule.cpp#L88
+def decode_temp(codes, offset, gain):
+    temp = (np.asarray(codes, dtype=np.float64) + offset) / gain
+    with np.errstate(divide="ignore", invalid="ignore"):
+        temp = ((1.78 / temp) - 3.57) * 1000
+        log_temp = np.log(temp)
+        kelvin = 1.0 / (
+            0.0007610373573
+            + (0.0002728524832 * log_temp)
+            + (log_temp**3 * 0.0000001022822735)
+        )
+    return np.where(temp > 0, np.round(kelvin - 273.15, 3), np.nan)
+
+
+# TS1/TS2 code to temperature tables, indexed by the 16 bits ADC code. Each table is computed
+# once with decode_temp on all the codes, at first use.
+TEMP_CODE_CONSTANTS = {1: (2, 33046), 2: (9, 33068)}  # temp_id: (offset, gain)
+TEMP_LUT_SIZE = 1 << 16
+_temp_luts = {}
+
+
+def temp_lut(temp_id):
+    lut = _temp_luts.get(temp_id)
+    if lut is None:
+        offset, gain = TEMP_CODE_CONSTANTS[temp_id]
+        lut = decode_temp(np.arange(TEMP_LUT_SIZE), offset, gain)
+        lut.flags.writeable = False
+        _temp_luts[temp_id] = lut
+    return lut
+
+
+# Vectorized decoding of N ADC results blocks (ADC_NB_MEAS bytes read at ADC_RES_ADDR each).
+# results: contiguous blocks (bytes-like, or uint8 array of shape (N, ADC_NB_MEAS)), or a
+# sequence of blocks. The 16 bits codes are a big-endian view over the buffer, no copy.
+# A 16 bits codes array of shape (N, ADC_NB_CHANNELS) is used as is (e.g. sample log records).
+# Returns (gpai[N], vcells[N, 6], temps[N, 2]) float64 arrays, in mV and degC.
+def decode_adc_frames(results):
+    if isinstance(results, np.ndarray) and results.dtype.itemsize == 2:
+        codes = results.reshape(-1, ADC_NB_CHANNELS)
+    else:
+        if isinstance(results, (list, tuple)):
+            results = b"".join(bytes(result) for result in results)
+        codes = np.frombuffer(results, dtype=ADC_RES_DTYPE).reshape(-1, ADC_NB_CHANNELS)
+    values = codes.astype(np.float64)
     # Voltages returned are in mV. See sections 7.3.1.3 to 7.3.1.5 from the TI BQ76 datasheet.
-    rx_data = read_bq76(ser, id, ADC_RES_ADDR, ADC_NB_MEAS)
-    gpai = rx_data[3] << 8 | rx_data[4]
-    gpai = round(gpai * 33333 / 16383, 2)
-    vcell1 = rx_data[5] << 8 | rx_data[6]
-    vcell1 = round(vcell1 * 6250 / 16383, 2)
-    vcell2 = rx_data[7] << 8 | rx_data[8]
-    vcell2 = round(vcell2 * 6250 / 16383, 2)
-    vcell3 = rx_data[9] << 8 | rx_data[10]
-    vcell3 = round(vcell3 * 6250 / 16383, 2)
-    vcell4 = rx_data[11] << 8 | rx_data[12]
-    vcell4 = round(vcell4 * 6250 / 16383, 2)
-    vcell5 = rx_data[13] << 8 | rx_data[14]
-    vcell5 = round(vcell5 * 6250 / 16383, 2)
-    vcell6 = rx_data[15] << 8 | rx_data[16]
-    vcell6 = round(vcell6 * 6250 / 16383, 2)
-    # Temperatures are operated using the steinhart/hart equation
-    # See the readModuleValues function at https://github.com/collin80/TeslaBMS/blob/master/BMSModule.cpp#L88
-    temp1 = rx_data[17] << 8 | rx_data[18]
-    temp1 = (temp1 + 2) / 33046
-    temp1 = ((1.78 / temp1) - 3.57) * 1000
-    temp1 = 1.0 / (
-        0.0007610373573
-        + (0.0002728524832 * math.log(temp1))
-        + (pow(math.log(temp1), 3) * 0.0000001022822735)
-    )
-    temp1 = round(temp1 - 273.15, 3)
-    temp2 = rx_data[19] << 8 | rx_data[20]
-    temp2 = (temp2 + 9) / 33068
-    temp2 = ((1.78 / temp2) - 3.57) * 1000
-    temp2 = 1.0 / (
-        0.0007610373573
-        + (0.0002728524832 * math.log(temp2))
-        + (pow(math.log(temp2), 3) * 0.0000001022822735)
-    )
-    temp2 = round(temp2 - 273.15, 3)
-    _print(gpai, vcell1, vcell2, vcell3, vcell4, vcell5, vcell6, temp1, temp2, "\n")
+    gpai = np.round(values[:, 0] * 33333 / 16383, 2)
+    vcells = np.round(values[:, 1:7] * 6250 / 16383, 2)
+    temps = np.column_stack((temp_lut(1)[codes[:, 7]], temp_lut(2)[codes[:, 8]]))
+    return gpai, vcells, temps
+
 
-    # Setting back registers' content before returning
-    write_bq76(ser, id, ADC_CONFIG_ADDR, adc_config_reg_backup)
-    write_bq76(ser, id, IO_CONFIG_ADDR, io_config_reg_backup)
+# Measurements tuple of one row of decode_adc_frames output
+def adc_meas_row(decoded, row=0):
+    gpai, vcells, temps = decoded
+    return tuple(float(value) for value in (gpai[row], *vcells[row], *temps[row]))
 
-    return gpai, vcell1, vcell2, vcell3, vcell4, vcell5, vcell6, temp1, temp2
+
+# Decode the answer to the ADC results read (one row of decode_adc_frames)
+# Returns (GPAI, Vcell1, Vcell2, Vcell3, Vcell4, Vcell5, Vcell6, Temp1, Temp2)
+def decode_adc_meas(rx_data):
+    meas = adc_meas_row(
+        decode_adc_frames(
+            rx_data[READ_FRAME_HEADER_SIZE : READ_FRAME_HEADER_SIZE + ADC_NB_MEAS]
+        )
+    )
+    _print(*meas, "\n")
+
+    return meas
 
 
 def read_alerts(*, ser, id):
@@ -274,6 +1021,28 @@ def read_alerts(*, ser, id):
     return rx_data[3]
 
 
+# Alerts, faults, OV cells and UV cells registers read in one pipelined exchange
+def read_status(*, ser, id):
+    regs = read_registers(
+        ser=ser,
+        id=id,
+        reg_addrs=(ALERT_STATUS_ADDR, FAULT_STATUS_ADDR, OV_CELLS_ADDR, UV_CELLS_ADDR),
+    )
+    return tuple(regs.values())
+
+
+# OV, UV and OT thresholds read at once, decoded as get_ov_thr, get_uv_thr and get_ot_thr do
+def read_secu_thr(*, ser, id):
+    regs = read_registers(
+        ser=ser, id=id, reg_addrs=(OV_REG_ADDR, UV_REG_ADDR, OT_REG_ADDR)
+    )
+    return (
+        decode_ov_thr(regs[OV_REG_ADDR], id),
+        decode_uv_thr(regs[UV_REG_ADDR], id),
+        decode_ot_thr(regs[OT_REG_ADDR], id),
+    )
+
+
 def clear_cuv_cov_faults(*, ser, id):
     rx_data = read_bq76(ser, id, FAULT_STATUS_ADDR, 0x1)
     write_bq76(ser, id, FAULT_STATUS_ADDR, rx_data[3] | 0x03)
@@ -299,118 +1068,140 @@ def get_ov_thr(*, ser, id):
     rx_data = read_bq76(ser, id, OV_REG_ADDR, 0x1)
     if rx_data == None:
         return -1
-    if rx_data[3] & 0x80:
-        _print(f"Overvoltage protection disabled for slave #{id}.\n")
+    return decode_ov_thr(rx_data[3], id)
+
+
+def decode_ov_thr(ov_reg, id):
+    if ov_reg & 0x80:
+        if _trace_level >= TRACE_INFO:
+            _print(f"Overvoltage protection disabled for slave #{id}.\n")
         return -1
     else:
-        ov_thr = 2 + int(rx_data[3]) * 0.050
-        _print(f"Overvoltage threshold (slave #{id})= {ov_thr} V.\n")
+        ov_thr = 2 + int(ov_reg) * 0.050
+        if _trace_level >= TRACE_INFO:
+            _print(f"Overvoltage threshold (slave #{id})= {ov_thr} V.\n")
         return ov_thr
 
 
-def set_ov_thr(*, ser, id, new_ov_thr_v):
-    # Unlock protected registers
-    rx_data = read_bq76(ser, id, SHDW_REG_ADDR, 0x1)
-    shdw_reg_backup = rx_data[3]
-    rx_data = write_bq76(
-        ser, id, SHDW_REG_ADDR, shdw_reg_backup | SHDW_UNLOCK_MAGIC_CODE
-    )
-    _print(f"Unlock protected registers for slave {id}.\n")
+def ov_thr_to_reg(ov_thr_v):
+    return int((ov_thr_v - 2) / 0.050)
+
 
-    new_ov_thr = int((new_ov_thr_v - 2) / 0.050)
-    rx_data = write_bq76(ser, id, OV_REG_ADDR, new_ov_thr)
+# Check the echo of a threshold register write, returns -1 if the write did not go through
+def check_thr_echo(thr_name, id, rx_data, expected):
     if len(rx_data) < 3:
-        _print(f"ERROR: set_ov_thr({new_ov_thr}) for slave #{id} failed.\n")
+        if _trace_level >= TRACE_INFO:
+            _print(
+                f"ERROR: set_{thr_name.lower()}({expected}) for slave #{id} failed.\n"
+            )
         return -1
-    if rx_data[2] == new_ov_thr:
-        _print(f"OV_THR update OK: {new_ov_thr}=={rx_data[2]}.\n")
+    if rx_data[2] == expected:
+        if _trace_level >= TRACE_INFO:
+            _print(f"{thr_name} update OK: {expected}=={rx_data[2]}.\n")
     else:
-        _print(f"OV_THR update NOK: {new_ov_thr}!={rx_data[2]}.\n")
+        if _trace_level >= TRACE_INFO:
+            _print(f"{thr_name} update NOK: {expected}!={rx_data[2]}.\n")
+    return 0
+
+
+# Write val to the protected register reg_addr: unlock, write and check the echo, lock back
+def write_protected_steps(id, thr_name, reg_addr, val):
+    # Unlock protected registers
+    shdw_reg_backup = yield (STEP_READ_REG, id, SHDW_REG_ADDR)
+    yield (STEP_WRITE, id, SHDW_REG_ADDR, shdw_reg_backup | SHDW_UNLOCK_MAGIC_CODE)
+    if _trace_level >= TRACE_INFO:
+        _print(f"Unlock protected registers for slave {id}.\n")
+
+    rx_data = yield (STEP_WRITE, id, reg_addr, val)
+    if check_thr_echo(thr_name, id, rx_data, val) == -1:
+        return -1
 
     # Set back protected registers lock state
-    rx_data = write_bq76(ser, id, SHDW_REG_ADDR, shdw_reg_backup)
-    _print(f"Set back protected registers lock state for slave {id}.\n")
+    yield (STEP_WRITE, id, SHDW_REG_ADDR, shdw_reg_backup)
+    if _trace_level >= TRACE_INFO:
+        _print(f"Set back protected registers lock state for slave {id}.\n")
+
+
+def set_ov_thr(*, ser, id, new_ov_thr_v):
+    return run_steps(ser, set_ov_thr_steps(id, new_ov_thr_v))
+
+
+def set_ov_thr_steps(id, new_ov_thr_v):
+    return write_protected_steps(id, "OV_THR", OV_REG_ADDR, ov_thr_to_reg(new_ov_thr_v))
 
 
 def get_uv_thr(*, ser, id):
     rx_data = read_bq76(ser, id, UV_REG_ADDR, 0x1)
     if rx_data == None:
         return -1
-    if rx_data[3] & 0x80:
-        _print(f"Undervoltage protection disabled for slave #{id}.\n")
+    return decode_uv_thr(rx_data[3], id)
+
+
+def decode_uv_thr(uv_reg, id):
+    if uv_reg & 0x80:
+        if _trace_level >= TRACE_INFO:
+            _print(f"Undervoltage protection disabled for slave #{id}.\n")
         return -1
     else:
-        uv_thr = 0.7 + int(rx_data[3]) * 0.1
-        _print(f"Undervoltage threshold (slave #{id})= {uv_thr} V.\n")
+        uv_thr = 0.7 + int(uv_reg) * 0.1
+        if _trace_level >= TRACE_INFO:
+            _print(f"Undervoltage threshold (slave #{id})= {uv_thr} V.\n")
         return uv_thr
 
 
+def uv_thr_to_reg(uv_thr_v):
+    return int((uv_thr_v - 0.7) / 0.1)
+
+
 def set_uv_thr(*, ser, id, new_uv_thr_v):
-    # Unlock protected registers
-    rx_data = read_bq76(ser, id, SHDW_REG_ADDR, 0x1)
-    shdw_reg_backup = rx_data[3]
-    rx_data = write_bq76(
-        ser, id, SHDW_REG_ADDR, shdw_reg_backup | SHDW_UNLOCK_MAGIC_CODE
-    )
-    _print(f"Unlock protected registers for slave {id}.\n")
+    return run_steps(ser, set_uv_thr_steps(id, new_uv_thr_v))
 
-    new_uv_thr = int((new_uv_thr_v - 0.7) / 0.1)
-    rx_data = write_bq76(ser, id, UV_REG_ADDR, new_uv_thr)
-    if len(rx_data) < 3:
-        _print(f"ERROR: set_uv_thr({new_uv_thr}) for slave #{id} failed.\n")
-        return -1
-    if rx_data[2] == new_uv_thr:
-        _print(f"UV_THR update OK: {new_uv_thr}=={rx_data[2]}.\n")
-    else:
-        _print(f"UV_THR update NOK: {new_uv_thr}!={rx_data[2]}.\n")
 
-    # Set back protected registers lock state
-    rx_data = write_bq76(ser, id, SHDW_REG_ADDR, shdw_reg_backup)
-    _print(f"Set back protected registers lock state for slave {id}.\n")
+def set_uv_thr_steps(id, new_uv_thr_v):
+    return write_protected_steps(id, "UV_THR", UV_REG_ADDR, uv_thr_to_reg(new_uv_thr_v))
 
 
 def get_ot_thr(*, ser, id):
     rx_data = read_bq76(ser, id, OT_REG_ADDR, 0x1)
     if rx_data == None:
         return -1
-    if rx_data[3] & 0x80:
-        _print(f"Over temperature protection disabled for slave #{id}.\n")
+    return decode_ot_thr(rx_data[3], id)
+
+
+def decode_ot_thr(ot_reg, id):
+    if ot_reg & 0x80:
+        if _trace_level >= TRACE_INFO:
+            _print(f"Over temperature protection disabled for slave #{id}.\n")
         return -1
     else:
-        _print(f"Over temperature threshold configured (slave #{id}).\n")
-        ot1_thr = rx_data[3] & 0x0F
-        ot2_thr = (rx_data[3] & 0xF0) >> 4
+        if _trace_level >= TRACE_INFO:
+            _print(f"Over temperature threshold configured (slave #{id}).\n")
+        ot1_thr = ot_reg & 0x0F
+        ot2_thr = (ot_reg & 0xF0) >> 4
         return ot1_thr, ot2_thr
 
 
+# Update the OT register nibble of temp_id (1 or 2) with the threshold value of new_ot_thr_deg
+def ot_thr_to_reg(ot_reg, new_ot_thr_deg, temp_id):
+    new_ot_thr = OT_THR_TO_CELCIUS_LU_TABLE_REVERSE[new_ot_thr_deg]
+    if temp_id == 1:
+        return (ot_reg & 0xF0) | (new_ot_thr & 0x0F)
+    return (ot_reg & 0x0F) | (new_ot_thr << 4)
+
+
 def set_ot_thr(*, ser, id, new_ot_thr_deg, temp_id):
+    return run_steps(ser, set_ot_thr_steps(id, new_ot_thr_deg, temp_id))
+
+
+def set_ot_thr_steps(id, new_ot_thr_deg, temp_id):
     # Check temp_id is valid (there is only two temperatures on TI BQ76)
     if temp_id not in [1, 2]:
         return -1
-    # Unlock protected registers
-    rx_data = read_bq76(ser, id, SHDW_REG_ADDR, 0x1)
-    shdw_reg_backup = rx_data[3]
-    rx_data = write_bq76(
-        ser, id, SHDW_REG_ADDR, shdw_reg_backup | SHDW_UNLOCK_MAGIC_CODE
+    # Both thresholds share OT_REG_ADDR, the other one is kept
+    ot_reg = yield (STEP_READ_REG, id, OT_REG_ADDR)
+    new_ot_reg = ot_thr_to_reg(ot_reg, new_ot_thr_deg, temp_id)
+    return (
+        yield from write_protected_steps(
+            id, f"OT{temp_id}_THR", OT_REG_ADDR, new_ot_reg
+        )
     )
-    _print(f"Unlock protected registers for slave {id}.\n")
-
-    new_ot_thr = OT_THR_TO_CELCIUS_LU_TABLE_REVERSE[new_ot_thr_deg]
-    rx_data = read_bq76(ser, id, OT_REG_ADDR, 0x1)
-    ot_reg_backup = rx_data[3]
-    if temp_id == 1:
-        new_ot_reg = (ot_reg_backup & 0xF0) | (new_ot_thr & 0x0F)
-    elif temp_id == 2:
-        new_ot_reg = (ot_reg_backup & 0x0F) | (new_ot_thr << 4)
-    rx_data = write_bq76(ser, id, OT_REG_ADDR, new_ot_reg)
-    if len(rx_data) < 3:
-        _print(f"ERROR: set_ot{temp_id}_thr({new_ot_thr}) for slave #{id} failed.\n")
-        return -1
-    if rx_data[2] == new_ot_thr:
-        _print(f"OT{temp_id}_THR update OK: {new_ot_thr}=={rx_data[2]}.\n")
-    else:
-        _print(f"OT{temp_id}_THR update NOK: {new_ot_thr}!={rx_data[2]}.\n")
-
-    # Set back protected registers lock state
-    rx_data = write_bq76(ser, id, SHDW_REG_ADDR, shdw_reg_backup)
-    _print(f"Set back protected registers lock state for slave {id}.\n")
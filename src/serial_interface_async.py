@@ -0,0 +1,395 @@
+import asyncio
+import serial
+import time
+
+import serial_interface as si
+
+from serial_interface import (
+    ADDRESS_CONTROL_ADDR,
+    ADDR_RANGE_FULL_SIZE,
+    ALERT_STATUS_ADDR,
+    FAULT_STATUS_ADDR,
+    OT_REG_ADDR,
+    OV_CELLS_ADDR,
+    OV_REG_ADDR,
+    READ_FRAME_HEADER_SIZE,
+    READ_PLAN_MAX_GAP,
+    RESET_MAGIC_CODE,
+    RESET_REG_ADDR,
+    SERIAL_BAUDRATE,
+    SERIAL_INTER_BYTE_TIMEOUT,
+    SERIAL_TIMEOUT,
+    STEP_PROBE,
+    STEP_READ,
+    STEP_READ_RANGES,
+    STEP_READ_REG,
+    STEP_SLEEP,
+    STEP_WRITE,
+    TRACE_FRAMES,
+    TRACE_INFO,
+    UV_CELLS_ADDR,
+    UV_REG_ADDR,
+    WRITE_FRAME_SIZE,
+    AdcSample,
+    _print,
+    check_read_answer,
+    check_slave_id_echo,
+    decode_adc_meas,
+    decode_ot_thr,
+    decode_ov_thr,
+    decode_uv_thr,
+    forget_port_shadows,
+    next_deadline,
+    get_shadow,
+    print_packet,
+    probe_answer_ok,
+    read_frame_size,
+    read_packet,
+    read_ranges_batch,
+    save_slave_id,
+    shadow_read_done,
+    shadow_write_done,
+    write_packet,
+)
+
+
+# Non-blocking serial stream: the port file descriptor is watched by the event loop reader
+# and received bytes are buffered until a transaction has its expected answer length.
+# On platforms without a selectable serial fd (Windows), each transfer runs the blocking
+# serial_interface.transfer in the default executor instead.
+class AsyncSerial:
+    def __init__(self, ser):
+        self.ser = ser
+        self.port = ser.port
+        self.name = ser.name
+        self._loop = asyncio.get_running_loop()
+        self._lock = asyncio.Lock()
+        self._buffer = bytearray()
+        self._data_event = asyncio.Event()
+        self._fd = None
+        if hasattr(ser, "fileno"):
+            try:
+                self._fd = ser.fileno()
+            except (AttributeError, NotImplementedError, OSError):
+                self._fd = None
+        if self._fd is not None:
+            self.ser.timeout = 0
+            self._loop.add_reader(self._fd, self._on_readable)
+
+    def _on_readable(self):
+        data = self.ser.read(self.ser.in_waiting or 1)
+        if data:
+            self._buffer += data
+            self._data_event.set()
+
+    async def _read(self, expected_size, timeout, inter_byte_timeout):
+        deadline = self._loop.time() + timeout
+        while len(self._buffer) < expected_size:
+            remaining = deadline - self._loop.time()
+            if self._buffer:
+                remaining = min(remaining, inter_byte_timeout)
+            if remaining <= 0:
+                break
+            self._data_event.clear()
+            try:
+                await asyncio.wait_for(self._data_event.wait(), remaining)
+            except asyncio.TimeoutError:
+                break
+        ans = bytes(self._buffer[:expected_size])
+        del self._buffer[:expected_size]
+        return ans
+
+    # Same contract as serial_interface.transfer, one transaction at a time per port
+    async def transfer(
+        self,
+        packet,
+        expected_size,
+        *,
+        timeout=SERIAL_TIMEOUT,
+        inter_byte_timeout=SERIAL_INTER_BYTE_TIMEOUT,
+    ):
+        async with self._lock:
+            if self._fd is None:
+                ans = await self._loop.run_in_executor(
+                    None,
+                    self._blocking_transfer,
+                    packet,
+                    expected_size,
+                    timeout,
+                    inter_byte_timeout,
+                )
+                return ans
+            # Drop late bytes from a previous answer, not read yet or already buffered
+            self.ser.reset_input_buffer()
+            self._buffer.clear()
+            self.ser.write(packet)
+            ans = await self._read(expected_size, timeout, inter_byte_timeout)
+        if si.get_trace_level() >= TRACE_FRAMES:
+            print_packet("tx", packet)
+            print_packet("rx", ans)
+        return ans
+
+    # Executor side of transfer when the port has no file descriptor to watch (Windows)
+    def _blocking_transfer(self, packet, expected_size, timeout, inter_byte_timeout):
+        timeout_backup = self.ser.timeout, self.ser.inter_byte_timeout
+        self.ser.timeout = timeout
+        self.ser.inter_byte_timeout = inter_byte_timeout
+        try:
+            return si.transfer(self.ser, packet, expected_size)
+        finally:
+            self.ser.timeout, self.ser.inter_byte_timeout = timeout_backup
+
+    def close(self):
+        if self._fd is not None:
+            self._loop.remove_reader(self._fd)
+            self._fd = None
+        self.ser.close()
+
+
+# Connect to serial port identified by port_name, must be called from a running event loop
+async def con_serial_port(port_name):
+    forget_port_shadows(port_name)
+    try:
+        serial_con = serial.Serial(
+            port=port_name,
+            baudrate=SERIAL_BAUDRATE,
+            timeout=SERIAL_TIMEOUT,
+            inter_byte_timeout=SERIAL_INTER_BYTE_TIMEOUT,
+        )
+    except IOError:
+        if si.get_trace_level() >= TRACE_INFO:
+            _print(
+                f"ERROR: can't open {port_name}. Check its config (serial_interface_async.con_serial_port)."
+            )
+        return None
+    if si.get_trace_level() >= TRACE_INFO:
+        _print(f"Connection has been set to {port_name}.")
+    return AsyncSerial(serial_con)
+
+
+def disco_serial_port(serial_con):
+    return si.disco_serial_port(serial_con)
+
+
+async def read_bq76(ser, id, reg_addr, length):
+    if si.get_trace_level() >= TRACE_FRAMES:
+        _print(f"-> Reading {length} bytes at @{hex(reg_addr)} from BQ76 #{id}")
+    ans = await ser.transfer(read_packet(id, reg_addr, length), read_frame_size(length))
+    check_read_answer(ans, id, length)
+    shadow_read_done(ser, id, reg_addr, ans)
+    return ans
+
+
+async def write_bq76(ser, id, reg_addr, val):
+    if si.get_trace_level() >= TRACE_FRAMES:
+        _print(f"-> Writing {hex(val)} at @{hex(reg_addr)} of BQ76 #{id}")
+    packet = write_packet(id, reg_addr, val)
+    ans = await ser.transfer(packet, WRITE_FRAME_SIZE)
+    shadow_write_done(ser, id, reg_addr, val, packet, ans)
+    if si.get_trace_level() >= TRACE_FRAMES:
+        _print("")
+    return ans
+
+
+# Register value from the shadow if it is cacheable and known, read from the slave otherwise
+async def read_reg(ser, id, reg_addr):
+    val = get_shadow(ser, id).get(reg_addr)
+    if val is None:
+        val = (await read_bq76(ser, id, reg_addr, 0x1))[3]
+    return val
+
+
+async def full_dump(*, ser, id):
+    rx_data = await read_bq76(ser, id, 0x00, ADDR_RANGE_FULL_SIZE)
+    if si.get_trace_level() >= TRACE_INFO:
+        _print(f"Full dump done for slave {id}.\n")
+    return rx_data[READ_FRAME_HEADER_SIZE:-1]
+
+
+async def reset_slave(*, ser, id):
+    rx_data = await write_bq76(ser, id, RESET_REG_ADDR, RESET_MAGIC_CODE)
+    if si.get_trace_level() >= TRACE_INFO:
+        _print(f"Reset slave {id}.\n")
+    return rx_data
+
+
+async def probe_slave(ser, tested_id):
+    rx_data = await ser.transfer(
+        read_packet(tested_id, ADDRESS_CONTROL_ADDR, 0x1),
+        read_frame_size(0x1),
+        timeout=si.get_probe_timeout(),
+    )
+    if probe_answer_ok(rx_data, tested_id):
+        return rx_data
+    return None
+
+
+# Executes the serial_interface step generators (see run_steps there) with awaited I/O
+async def run_steps(ser, steps):
+    result = None
+    try:
+        while True:
+            result = await run_step(ser, steps.send(result))
+    except StopIteration as stop:
+        return stop.value
+
+
+async def run_step(ser, step):
+    kind, *args = step
+    if kind == STEP_READ:
+        return await read_bq76(ser, *args)
+    if kind == STEP_WRITE:
+        return await write_bq76(ser, *args)
+    if kind == STEP_READ_REG:
+        return await read_reg(ser, *args)
+    if kind == STEP_READ_RANGES:
+        batch = read_ranges_batch(ser, *args)
+        return batch.process(await ser.transfer(batch.packets, batch.expected_size))
+    if kind == STEP_PROBE:
+        return await probe_slave(ser, *args)
+    if kind == STEP_SLEEP:
+        await asyncio.sleep(*args)
+        return None
+    raise ValueError(f"Unknown step {kind}")
+
+
+async def get_slave_id(*, ser, use_broadcast=True):
+    return await run_steps(ser, si.get_slave_id_steps(ser.port, use_broadcast))
+
+
+async def set_slave_id(*, ser, old_id, new_id):
+    rx_data = await write_bq76(ser, old_id, ADDRESS_CONTROL_ADDR, 0x80 | new_id)
+    if check_slave_id_echo(rx_data, old_id, new_id) == -1:
+        return -1
+    save_slave_id(ser.port, new_id)
+    return 0
+
+
+async def start_adc_meas(*, ser, id, adc_config=None):
+    return await run_steps(ser, si.start_adc_meas_steps(id, adc_config))
+
+
+# Same as serial_interface.AdcSession, used with "async with"
+class AdcSession(si.AdcSessionSteps):
+    async def open(self):
+        return await run_steps(self.ser, self.open_steps())
+
+    async def close(self):
+        await run_steps(self.ser, self.close_steps())
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def sample_raw(self):
+        return await run_steps(self.ser, self.sample_raw_steps())
+
+    async def sample(self):
+        return decode_adc_meas(await self.sample_raw())
+
+
+async def read_adc_meas(*, ser, id):
+    async with AdcSession(ser, id) as session:
+        return await session.sample()
+
+
+# Same as serial_interface.stream_adc, used with "async for"
+async def stream_adc(*, ser, id, rate_hz, count=None):
+    period = 1 / rate_hz
+    seq = 0
+    missed = 0
+    async with AdcSession(ser, id) as session:
+        deadline = time.monotonic()
+        while count is None or seq < count:
+            remaining = deadline - time.monotonic()
+            if remaining > 0:
+                await asyncio.sleep(remaining)
+            timestamp = time.time()
+            meas = await session.sample()
+            yield AdcSample(
+                seq, deadline, timestamp, meas, session.conv_latency, missed
+            )
+            seq += 1
+            deadline, missed = next_deadline(deadline, period, time.monotonic())
+            if missed and si.get_trace_level() >= TRACE_INFO:
+                _print(f"ADC stream of slave {id}: {missed} deadline(s) missed.")
+
+
+async def read_alerts(*, ser, id):
+    rx_data = await read_bq76(ser, id, ALERT_STATUS_ADDR, 0x1)
+    return rx_data[3]
+
+
+async def read_faults(*, ser, id):
+    rx_data = await read_bq76(ser, id, FAULT_STATUS_ADDR, 0x1)
+    return rx_data[3]
+
+
+async def read_ov_cells(*, ser, id):
+    rx_data = await read_bq76(ser, id, OV_CELLS_ADDR, 0x1)
+    return rx_data[3]
+
+
+async def read_uv_cells(*, ser, id):
+    rx_data = await read_bq76(ser, id, UV_CELLS_ADDR, 0x1)
+    return rx_data[3]
+
+
+# Same as serial_interface.read_registers, the planned ranged reads are pipelined in one exchange
+async def read_registers(*, ser, id, reg_addrs, max_gap=READ_PLAN_MAX_GAP):
+    return await run_steps(ser, si.read_registers_steps(id, reg_addrs, max_gap))
+
+
+async def read_status(*, ser, id):
+    regs = await read_registers(
+        ser=ser,
+        id=id,
+        reg_addrs=(ALERT_STATUS_ADDR, FAULT_STATUS_ADDR, OV_CELLS_ADDR, UV_CELLS_ADDR),
+    )
+    return tuple(regs.values())
+
+
+async def read_secu_thr(*, ser, id):
+    regs = await read_registers(
+        ser=ser, id=id, reg_addrs=(OV_REG_ADDR, UV_REG_ADDR, OT_REG_ADDR)
+    )
+    return (
+        decode_ov_thr(regs[OV_REG_ADDR], id),
+        decode_uv_thr(regs[UV_REG_ADDR], id),
+        decode_ot_thr(regs[OT_REG_ADDR], id),
+    )
+
+
+async def clear_cuv_cov_faults(*, ser, id):
+    rx_data = await read_bq76(ser, id, FAULT_STATUS_ADDR, 0x1)
+    await write_bq76(ser, id, FAULT_STATUS_ADDR, rx_data[3] | 0x03)
+    await write_bq76(ser, id, FAULT_STATUS_ADDR, rx_data[3] & 0x3C)
+
+
+async def get_ov_thr(*, ser, id):
+    rx_data = await read_bq76(ser, id, OV_REG_ADDR, 0x1)
+    return decode_ov_thr(rx_data[3], id)
+
+
+async def get_uv_thr(*, ser, id):
+    rx_data = await read_bq76(ser, id, UV_REG_ADDR, 0x1)
+    return decode_uv_thr(rx_data[3], id)
+
+
+async def get_ot_thr(*, ser, id):
+    rx_data = await read_bq76(ser, id, OT_REG_ADDR, 0x1)
+    return decode_ot_thr(rx_data[3], id)
+
+
+async def set_ov_thr(*, ser, id, new_ov_thr_v):
+    return await run_steps(ser, si.set_ov_thr_steps(id, new_ov_thr_v))
+
+
+async def set_uv_thr(*, ser, id, new_uv_thr_v):
+    return await run_steps(ser, si.set_uv_thr_steps(id, new_uv_thr_v))
+
+
+async def set_ot_thr(*, ser, id, new_ot_thr_deg, temp_id):
+    return await run_steps(ser, si.set_ot_thr_steps(id, new_ot_thr_deg, temp_id))
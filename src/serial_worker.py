@@ -0,0 +1,86 @@
+import queue
+import threading
+
+from serial_interface import (
+    con_serial_port,
+    disco_serial_port,
+)
+
+RESULTS_POLL_PERIOD_MS = 20
+
+
+# Dedicated I/O thread owning the serial.Serial handle.
+# Jobs are callables taking the serial handle, they are run one after the other in
+# submission order. Their result (or exception) is handed back to the Tk thread, which
+# polls the results queue with root.after: Tk widgets are only touched from the Tk thread.
+class SerialWorker:
+    def __init__(self, root):
+        self.root = root
+        self.ser = None
+        self._jobs = queue.Queue()
+        self._results = queue.Queue()
+        self._thread = threading.Thread(
+            target=self._run, name="serial-worker", daemon=True
+        )
+        self._thread.start()
+        self.root.after(RESULTS_POLL_PERIOD_MS, self._poll_results)
+
+    # job(ser) runs in the worker thread, on_done(result) or on_error(exception) in the Tk thread
+    def submit(self, job, on_done=None, on_error=None):
+        self._jobs.put((job, on_done, on_error))
+
+    # Number of jobs submitted and not finished yet
+    def pending(self):
+        return self._jobs.unfinished_tasks
+
+    def connect(self, port_name, on_done=None, on_error=None):
+        self.submit(lambda ser: self._open(port_name), on_done, on_error)
+
+    def disconnect(self, on_done=None, on_error=None):
+        self.submit(self._close, on_done, on_error)
+
+    def stop(self):
+        self._jobs.put(None)
+
+    # Worker thread side
+    def _open(self, port_name):
+        # A handle left open would keep the port busy (the new open fails on Windows)
+        if self.ser is not None:
+            self._close(self.ser)
+        self.ser = con_serial_port(port_name)
+        return self.ser
+
+    def _close(self, ser):
+        if ser is None:
+            return False
+        self.ser = None
+        return disco_serial_port(ser)
+
+    def _run(self):
+        while True:
+            item = self._jobs.get()
+            if item is None:
+                self._jobs.task_done()
+                return
+            job, on_done, on_error = item
+            try:
+                result = job(self.ser)
+            except Exception as error:
+                self._results.put((on_error, error, False))
+            else:
+                self._results.put((on_done, result, True))
+            self._jobs.task_done()
+
+    # Tk thread side
+    def _poll_results(self):
+        # Reschedule first so a failing callback does not stop the polling
+        self.root.after(RESULTS_POLL_PERIOD_MS, self._poll_results)
+        while True:
+            try:
+                callback, value, success = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if callback is not None:
+                callback(value)
+            elif not success:
+                print(f"ERROR: serial job failed ({value!r})")
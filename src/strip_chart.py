@@ -0,0 +1,116 @@
+import numpy as np
+import tkinter as tk
+
+from serial_interface import (
+    ADC_NB_CHANNELS,
+    decode_adc_frames,
+)
+
+# Redraw rate cap of the plots, whatever the samples rate
+PLOT_MAX_FPS = 10
+PLOT_REFRESH_PERIOD_MS = 1000 // PLOT_MAX_FPS
+PLOT_WIDTH = 400
+PLOT_HEIGHT = 120
+PLOT_MARGIN = 4
+CELLS_COLORS = ["red", "orange", "gold", "green", "blue", "purple"]
+TEMPS_COLORS = ["red", "blue"]
+
+
+# Min/max decimation of values[N, k] to nb_columns: each column gets the min and the max of its
+# samples, so peaks stay visible whatever the number of samples. Values are returned unchanged
+# when there are less than 2 samples per column.
+# Returns (positions[M], values[M, k]) with positions the sample index of each point.
+def minmax_decimate(values, nb_columns):
+    nb_samples = len(values)
+    if nb_samples < 2 * nb_columns:
+        return np.arange(nb_samples), values
+    starts = np.linspace(0, nb_samples, nb_columns + 1).astype(int)[:-1]
+    mins = np.fmin.reduceat(values, starts, axis=0)
+    maxs = np.fmax.reduceat(values, starts, axis=0)
+    positions = np.repeat(starts, 2)
+    decimated = np.empty((2 * nb_columns,) + values.shape[1:], dtype=values.dtype)
+    decimated[0::2] = mins
+    decimated[1::2] = maxs
+    return positions, decimated
+
+
+# Strip chart of k channels on a Tk canvas. One line item per channel, moved with coords on
+# each draw (items are never recreated).
+class StripChart:
+    def __init__(self, master, title, unit, colors):
+        self.unit = unit
+        self.frame = tk.Frame(master, bg="paleturquoise3")
+        tk.Label(self.frame, text=title).grid(row=0, column=0, sticky="w")
+        self.range_label = tk.Label(self.frame, text="")
+        self.range_label.grid(row=0, column=1, sticky="e")
+        self.canvas = tk.Canvas(
+            self.frame, width=PLOT_WIDTH, height=PLOT_HEIGHT, bg="white"
+        )
+        self.canvas.grid(row=1, column=0, columnspan=2)
+        self.lines = [
+            self.canvas.create_line(0, 0, 0, 0, fill=color, state="hidden")
+            for color in colors
+        ]
+
+    # values[N, k] one column per channel, positions[N] the sample index of each row
+    def draw(self, positions, values):
+        finite = np.isfinite(values)
+        if len(values) < 2 or not finite.any():
+            for line in self.lines:
+                self.canvas.itemconfig(line, state="hidden")
+            self.range_label.config(text="")
+            return
+        low = values[finite].min()
+        high = values[finite].max()
+        span = (high - low) or 1.0
+        x = PLOT_MARGIN + positions * (PLOT_WIDTH - 2 * PLOT_MARGIN) / positions[-1]
+        y = (
+            PLOT_HEIGHT
+            - PLOT_MARGIN
+            - (values - low) * (PLOT_HEIGHT - 2 * PLOT_MARGIN) / span
+        )
+        for channel, line in enumerate(self.lines):
+            points = np.column_stack((x, y[:, channel]))[finite[:, channel]]
+            if len(points) < 2:
+                self.canvas.itemconfig(line, state="hidden")
+                continue
+            self.canvas.coords(line, points.ravel().tolist())
+            self.canvas.itemconfig(line, state="normal")
+        self.range_label.config(text=f"{low:.2f} .. {high:.2f} {self.unit}")
+
+
+# Cells voltages, GPAI and temperatures strip charts, fed by a SampleRing.
+# get_history() returns the SampleRing to plot (or None). The plots are redrawn at most
+# PLOT_MAX_FPS times per second, and only when new samples were appended.
+# The raw codes are decimated before decoding (voltages and temperatures are monotonic
+# functions of the codes), so a redraw decodes at most 2 * PLOT_WIDTH samples.
+class MeasurementsPlot:
+    def __init__(self, master, get_history):
+        self.master = master
+        self.get_history = get_history
+        self.frame = tk.Frame(master, bg="paleturquoise4")
+        self.cells_chart = StripChart(self.frame, "Vcell 1-6", "mV", CELLS_COLORS)
+        self.cells_chart.frame.grid(row=0, column=0, padx=5, pady=5)
+        self.gpai_chart = StripChart(self.frame, "Vbatt (GPAI)", "mV", ["black"])
+        self.gpai_chart.frame.grid(row=0, column=1, padx=5, pady=5)
+        self.temps_chart = StripChart(self.frame, "Temp 1-2", "degC", TEMPS_COLORS)
+        self.temps_chart.frame.grid(row=0, column=2, padx=5, pady=5)
+        self._drawn = None
+        self.master.after(PLOT_REFRESH_PERIOD_MS, self._refresh)
+
+    def _refresh(self):
+        self.master.after(PLOT_REFRESH_PERIOD_MS, self._refresh)
+        history = self.get_history()
+        state = None if history is None else (id(history), history.nb_appended)
+        if state == self._drawn:
+            return
+        self._drawn = state
+        if history is None or len(history) == 0:
+            codes = np.zeros((0, ADC_NB_CHANNELS), dtype=np.uint16)
+        else:
+            _, codes = history.window()
+        positions, codes = minmax_decimate(codes, PLOT_WIDTH)
+        gpai, vcells, temps = decode_adc_frames(np.ascontiguousarray(codes))
+        self.cells_chart.draw(positions, vcells)
+        self.gpai_chart.draw(positions, gpai[:, np.newaxis])
+        self.temps_chart.draw(positions, temps)
@@ -0,0 +1,53 @@
+_UNSET = object()
+
+
+# Coalesced, diff based widgets updates: the last option values rendered on each widget are
+# kept, only the options whose value changed are queued, and the queued changes of all the
+# widgets are applied in one root.after_idle pass (one per acquisition cycle, whatever the
+# number of widgets touched).
+#   view = ViewModel(root)
+#   view.update(label, text=value)
+class ViewModel:
+    def __init__(self, root):
+        self.root = root
+        # {widget: {option: value}}
+        self._rendered = {}
+        self._pending = {}
+        self._scheduled = False
+
+    def update(self, widget, **options):
+        rendered = self._rendered.get(widget, {})
+        for option, value in options.items():
+            if rendered.get(option, _UNSET) == value:
+                # Back to the rendered value: nothing to do (cancels a pending change)
+                self._pending.get(widget, {}).pop(option, None)
+            else:
+                self._pending.setdefault(widget, {})[option] = value
+        if self._pending and not self._scheduled:
+            self._scheduled = True
+            self.root.after_idle(self.flush)
+
+    # Value of a widget option as it will be once the pending changes are applied
+    def get(self, widget, option="text"):
+        pending = self._pending.get(widget, {})
+        if option in pending:
+            return pending[option]
+        rendered = self._rendered.get(widget, {})
+        if option in rendered:
+            return rendered[option]
+        return widget.cget(option)
+
+    def flush(self):
+        self._scheduled = False
+        pending, self._pending = self._pending, {}
+        for widget, options in pending.items():
+            if options:
+                widget.config(**options)
+                self._rendered.setdefault(widget, {}).update(options)
+
+    # Forget what was rendered (e.g. widgets changed without the view model)
+    def invalidate(self, widget=None):
+        if widget is None:
+            self._rendered.clear()
+        else:
+            self._rendered.pop(widget, None)
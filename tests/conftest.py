@@ -0,0 +1,37 @@
+import sys
+
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent.resolve() / "src"))
+
+import serial_interface as si
+
+from bq76_emulator import Bq76Emulator
+
+
+# Serial links to Bq76Emulator chains (pseudo terminals), closed at the end of the test.
+# The slave ID cache goes to a temporary state folder and tracing is off.
+#   ser, emu = bq76_link(Bq76Chain.of(3, first_id=1))
+@pytest.fixture
+def bq76_link(tmp_path, monkeypatch):
+    if not sys.platform.startswith("linux"):
+        pytest.skip("the BQ76 emulator needs a Linux pseudo terminal")
+    monkeypatch.setenv("XDG_STATE_HOME", str(tmp_path))
+    trace_level = si.get_trace_level()
+    si.set_trace_level("off")
+    links = []
+
+    def connect(chain, **emulator_options):
+        emu = Bq76Emulator(chain, **emulator_options).start()
+        ser = si.con_serial_port(emu.port)
+        links.append((ser, emu))
+        return ser, emu
+
+    yield connect
+    for ser, emu in links:
+        if ser.is_open:
+            si.disco_serial_port(ser)
+        emu.stop()
+    si.set_trace_level(trace_level)
@@ -0,0 +1,50 @@
+import sys
+
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.resolve() / "src"))
+
+from bq76_emulator import Bq76Chain, Bq76Module
+from serial_interface import (
+    ADC_CONFIG_ADDR,
+    IO_CONFIG_ADDR,
+    OV_REG_ADDR,
+    Bq76Batch,
+    read_frame_size,
+)
+
+
+def test_batch_answers_split_per_transaction(bq76_link):
+    board = Bq76Module(id=2)
+    board.regs[IO_CONFIG_ADDR] = 0x03
+    ser, _ = bq76_link(Bq76Chain([board]))
+    batch = Bq76Batch(ser)
+    batch.read(2, OV_REG_ADDR, 0x1)
+    batch.write(2, ADC_CONFIG_ADDR, 0x3D)
+    batch.read(2, ADC_CONFIG_ADDR, 0x2)
+    assert batch.expected_size == read_frame_size(0x1) + 4 + read_frame_size(0x2)
+
+    results = batch.run()
+
+    assert [res.is_write for res in results] == [False, True, False]
+    assert all(res.crc_ok for res in results)
+    assert bytes(results[0].data) == bytes((board.regs[OV_REG_ADDR],))
+    assert bytes(results[1].data) == b"\x3d"
+    # The write is done before the following read of the same exchange
+    assert bytes(results[2].data) == b"\x3d\x03"
+    assert len(batch) == 0
+
+
+# A missing slave only echoes its 3 bytes request: the following frames are misaligned and
+# reported with crc_ok=False, the frames before it are not affected
+def test_batch_missing_slave_misaligns_following_frames(bq76_link):
+    ser, _ = bq76_link(Bq76Chain.of(2, first_id=1))
+    batch = Bq76Batch(ser)
+    batch.read(1, OV_REG_ADDR, 0x1)
+    batch.read(9, OV_REG_ADDR, 0x1)
+    batch.read(2, OV_REG_ADDR, 0x1)
+
+    results = batch.run()
+
+    assert [res.crc_ok for res in results] == [True, False, False]
+    assert [res.id for res in results] == [1, 9, 2]
@@ -0,0 +1,32 @@
+import sys
+
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent.resolve() / "src"))
+
+import serial_interface as si
+
+from bq76_emulator import Bq76Chain, Bq76Module
+from pack_monitor import snapshot_adc
+from serial_interface import CrcNok
+
+
+# A missing module only echoes its requests, which shifts every later answer of the pipelined
+# exchange: the modules after it must still be read
+def test_snapshot_with_missing_module(bq76_link):
+    cells_mv = {1: 3500.0, 2: 3600.0, 3: 3700.0}
+    ser, _ = bq76_link(
+        Bq76Chain(Bq76Module(id=id, cells=[mv] * 6) for id, mv in cells_mv.items())
+    )
+    for id in (1, 2, 3):
+        si.AdcSession(ser, id).open()
+
+    snapshot = snapshot_adc(ser=ser, ids=[1, 9, 2, 3])
+
+    assert sorted(snapshot.meas) == [1, 2, 3]
+    assert list(snapshot.errors) == [9]
+    assert isinstance(snapshot.errors[9], CrcNok)
+    for id in (1, 2, 3):
+        assert snapshot.meas[id][1:7] == pytest.approx([cells_mv[id]] * 6, abs=1.0)
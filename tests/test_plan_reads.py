@@ -0,0 +1,59 @@
+import sys
+
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.resolve() / "src"))
+
+import serial_interface as si
+
+from bq76_emulator import Bq76Chain, Bq76Module
+from serial_interface import (
+    ALERT_STATUS_ADDR,
+    FAULT_STATUS_ADDR,
+    OT_REG_ADDR,
+    OV_CELLS_ADDR,
+    OV_REG_ADDR,
+    UV_CELLS_ADDR,
+    UV_REG_ADDR,
+    plan_reads,
+)
+
+
+def test_contiguous_registers_merged():
+    assert plan_reads([0x20, 0x21, 0x22]) == [(0x20, 3)]
+
+
+def test_gap_up_to_max_gap_merged():
+    assert plan_reads([0x42, 0x44, 0x46], max_gap=1) == [(0x42, 5)]
+    assert plan_reads([0x10, 0x13], max_gap=2) == [(0x10, 4)]
+
+
+def test_gap_above_max_gap_split():
+    assert plan_reads([0x10, 0x14], max_gap=2) == [(0x10, 1), (0x14, 1)]
+    assert plan_reads([0x42, 0x44], max_gap=0) == [(0x42, 1), (0x44, 1)]
+
+
+def test_unsorted_and_duplicated_addresses():
+    assert plan_reads([0x46, 0x42, 0x44, 0x42]) == [(0x42, 5)]
+    assert plan_reads([]) == []
+
+
+def test_read_registers_in_request_order(bq76_link):
+    board = Bq76Module(id=1)
+    for offset, reg_addr in enumerate(
+        (ALERT_STATUS_ADDR, FAULT_STATUS_ADDR, OV_CELLS_ADDR, UV_CELLS_ADDR)
+    ):
+        board.regs[reg_addr] = 0x10 + offset
+    ser, _ = bq76_link(Bq76Chain([board]))
+    reg_addrs = (
+        UV_CELLS_ADDR,
+        ALERT_STATUS_ADDR,
+        OT_REG_ADDR,
+        OV_REG_ADDR,
+        UV_REG_ADDR,
+    )
+
+    regs = si.read_registers(ser=ser, id=1, reg_addrs=reg_addrs)
+
+    assert list(regs) == list(reg_addrs)
+    assert regs == {reg_addr: board.regs[reg_addr] for reg_addr in reg_addrs}
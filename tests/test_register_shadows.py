@@ -0,0 +1,91 @@
+import sys
+
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.resolve() / "src"))
+
+import serial_interface as si
+
+from bq76_emulator import Bq76Chain, Bq76Module
+from serial_interface import (
+    ADC_CONFIG_ADDR,
+    IO_CONFIG_ADDR,
+    OT_REG_ADDR,
+    OV_REG_ADDR,
+    UV_REG_ADDR,
+)
+
+OTHER_BOARD_EEPROM = {OV_REG_ADDR: 0x2C, UV_REG_ADDR: 0x14, OT_REG_ADDR: 0x99}
+
+
+# OT1 is the low nibble of OT_REG_ADDR, OT2 the high one: setting OT1 must keep the board OT2
+def test_board_swap_keeps_other_ot_threshold(bq76_link):
+    board_a = Bq76Module(id=1)
+    board_b = Bq76Module(id=1, eeprom=OTHER_BOARD_EEPROM)
+    ser, emu = bq76_link(Bq76Chain([board_a]))
+    si.set_ot_thr(ser=ser, id=1, new_ot_thr_deg=50, temp_id=1)
+    si.disco_serial_port(ser)
+
+    emu.chain.modules = [board_b]
+    ser = si.con_serial_port(emu.port)
+    si.set_ot_thr(ser=ser, id=1, new_ot_thr_deg=40, temp_id=1)
+    si.disco_serial_port(ser)
+
+    new_ot1 = si.OT_THR_TO_CELCIUS_LU_TABLE_REVERSE[40]
+    assert board_b.regs[OT_REG_ADDR] == 0x90 | new_ot1
+
+
+# Board B config, different from the board A one the shadows were filled with
+def set_board_config(board, adc_config=0x21, io_config=0x80):
+    board.regs[ADC_CONFIG_ADDR] = adc_config
+    board.regs[IO_CONFIG_ADDR] = io_config
+
+
+def sample_once(ser, id):
+    with si.AdcSession(ser, id) as session:
+        session.sample()
+
+
+def test_reconnect_drops_port_shadows(bq76_link):
+    board_a = Bq76Module(id=1)
+    board_b = Bq76Module(id=1)
+    set_board_config(board_b)
+    ser, emu = bq76_link(Bq76Chain([board_a]))
+    sample_once(ser, 1)
+    si.disco_serial_port(ser)
+
+    emu.chain.modules = [board_b]
+    ser = si.con_serial_port(emu.port)
+    sample_once(ser, 1)
+    si.disco_serial_port(ser)
+
+    # The session set back board B config, not the board A one
+    assert (board_b.regs[ADC_CONFIG_ADDR], board_b.regs[IO_CONFIG_ADDR]) == (0x21, 0x80)
+
+
+def test_discovery_drops_port_shadows(bq76_link):
+    board_a = Bq76Module(id=1)
+    board_b = Bq76Module(id=1)
+    set_board_config(board_b)
+    ser, emu = bq76_link(Bq76Chain([board_a]))
+    sample_once(ser, 1)
+
+    # Board swapped without closing the port, found again by discovery
+    emu.chain.modules = [board_b]
+    assert si.get_slave_id(ser=ser) == 1
+    sample_once(ser, 1)
+
+    assert (board_b.regs[ADC_CONFIG_ADDR], board_b.regs[IO_CONFIG_ADDR]) == (0x21, 0x80)
+
+
+# The protected registers can be changed by the board itself (EEPROM reload) or another tool,
+# the read-modify-write of OT_REG_ADDR reads it from the board each time
+def test_ot_threshold_base_read_from_board(bq76_link):
+    board = Bq76Module(id=1)
+    ser, _ = bq76_link(Bq76Chain([board]))
+    si.set_ot_thr(ser=ser, id=1, new_ot_thr_deg=50, temp_id=1)
+    board.regs[OT_REG_ADDR] = 0x50 | (board.regs[OT_REG_ADDR] & 0x0F)
+
+    si.set_ot_thr(ser=ser, id=1, new_ot_thr_deg=40, temp_id=1)
+
+    assert board.regs[OT_REG_ADDR] >> 4 == 0x5
@@ -0,0 +1,54 @@
+import sys
+
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.resolve() / "src"))
+
+from serial_interface import ADC_NB_MEAS
+from sample_log import (
+    RECORD_STATUS_VALID,
+    SAMPLE_LOG_HEADER,
+    SAMPLE_RECORD,
+    SampleLogWriter,
+    read_sample_log,
+)
+
+
+def adc_results(seed):
+    return bytes((seed + i) & 0xFF for i in range(ADC_NB_MEAS))
+
+
+def test_status_recorded_with_sample(tmp_path):
+    path = tmp_path / "samples.bin"
+    with SampleLogWriter(path) as log:
+        log.append(1.0, 5, adc_results(0), (0x01, 0x02, 0x04, 0x08))
+        log.append(2.0, 5, adc_results(1))
+    records = read_sample_log(path)
+    assert list(records["flags"]) == [RECORD_STATUS_VALID, 0]
+    assert [tuple(records[field]) for field in ("alerts", "faults", "cov", "cuv")] == [
+        (0x01, 0),
+        (0x02, 0),
+        (0x04, 0),
+        (0x08, 0),
+    ]
+
+
+# A writer interrupted mid-record leaves a partial record, appending to the log must not
+# shift the new records by its bytes
+def test_append_after_partial_record(tmp_path):
+    path = tmp_path / "samples.bin"
+    with SampleLogWriter(path) as log:
+        for seq in range(3):
+            log.append(float(seq), 1, adc_results(seq))
+    with open(path, "r+b") as log_file:
+        log_file.truncate(SAMPLE_LOG_HEADER.size + 2 * SAMPLE_RECORD.size + 7)
+
+    with SampleLogWriter(path) as log:
+        log.append(10.0, 2, adc_results(10), (1, 2, 3, 4))
+
+    assert path.stat().st_size == SAMPLE_LOG_HEADER.size + 3 * SAMPLE_RECORD.size
+    records = read_sample_log(path)
+    assert list(records["timestamp"]) == [0.0, 1.0, 10.0]
+    assert list(records["id"]) == [1, 1, 2]
+    assert records["adc"][2].tobytes() == adc_results(10)
+    assert tuple(records[2][["alerts", "faults", "cov", "cuv"]]) == (1, 2, 3, 4)
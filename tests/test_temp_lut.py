@@ -0,0 +1,70 @@
+import math
+import sys
+
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent.resolve() / "src"))
+
+from serial_interface import (
+    ADC_NB_CHANNELS,
+    ADC_RES_DTYPE,
+    TEMP_CODE_CONSTANTS,
+    TEMP_LUT_SIZE,
+    decode_adc_frames,
+    decode_temp,
+    temp_lut,
+)
+
+
+# Scalar Steinhart-Hart conversion as done by decode_adc_meas before the lookup tables.
+# Returns None where the formula fails (thermistor resistance not positive).
+def scalar_temp(code, offset, gain):
+    temp = (code + offset) / gain
+    temp = ((1.78 / temp) - 3.57) * 1000
+    try:
+        temp = 1.0 / (
+            0.0007610373573
+            + (0.0002728524832 * math.log(temp))
+            + (pow(math.log(temp), 3) * 0.0000001022822735)
+        )
+    except ValueError:
+        return None
+    return round(temp - 273.15, 3)
+
+
+@pytest.mark.parametrize("temp_id", sorted(TEMP_CODE_CONSTANTS))
+def test_temp_lut_matches_scalar_formula(temp_id):
+    offset, gain = TEMP_CODE_CONSTANTS[temp_id]
+    lut = temp_lut(temp_id)
+    assert lut.shape == (TEMP_LUT_SIZE,)
+    assert not lut.flags.writeable
+    nan_codes = []
+    for code in range(TEMP_LUT_SIZE):
+        expected = scalar_temp(code, offset, gain)
+        if expected is None:
+            nan_codes.append(code)
+            assert math.isnan(lut[code]), code
+        else:
+            assert lut[code] == expected, code
+    # NaN domain: every code from the first one with a resistance not positive
+    assert nan_codes == list(range(nan_codes[0], TEMP_LUT_SIZE))
+    assert 16000 < nan_codes[0] < 17000
+
+
+@pytest.mark.parametrize("temp_id", sorted(TEMP_CODE_CONSTANTS))
+def test_temp_lut_matches_vectorized_formula(temp_id):
+    offset, gain = TEMP_CODE_CONSTANTS[temp_id]
+    expected = decode_temp(np.arange(TEMP_LUT_SIZE), offset, gain)
+    np.testing.assert_array_equal(temp_lut(temp_id), expected)
+
+
+def test_decode_adc_frames_temperatures_use_luts():
+    codes = np.zeros((TEMP_LUT_SIZE, ADC_NB_CHANNELS), dtype=ADC_RES_DTYPE)
+    codes[:, 7] = np.arange(TEMP_LUT_SIZE)
+    codes[:, 8] = np.arange(TEMP_LUT_SIZE)[::-1]
+    _, _, temps = decode_adc_frames(codes.tobytes())
+    np.testing.assert_array_equal(temps[:, 0], temp_lut(1))
+    np.testing.assert_array_equal(temps[:, 1], temp_lut(2)[::-1])